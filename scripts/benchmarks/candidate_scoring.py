@@ -0,0 +1,96 @@
+# Measures the cost of scoring the candidates of a fuzzy_match.LengthBucketIndex search, by query length, over the keys
+# of the query matcher generated from the data snapshot. Each query is compared against every key within its match
+# threshold of its length, both by the original loop which called the distance function for each candidate in turn, and
+# by the batched scoring stage with the occurrence-counting character masks. The batched stage counts bits with
+# int.bit_count when it's available (Python 3.10 and later).
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/candidate_scoring.py
+
+import time
+import random
+import asyncio
+import logging
+import jellyfish
+import data
+from fuzzy_match import Matcher, LengthBucketIndex
+from bot_modules.query import queries
+
+logging.getLogger().setLevel(logging.ERROR)
+
+QUERIES_PER_LENGTH = 200
+QUERY_LENGTHS = (4, 8, 12, 16, 20, 24, 32)
+
+
+def original_character_mask(s: str):
+    # LengthBucketIndex.get_character_mask before it counted second occurrences
+    mask = 0
+    for c in s:
+        mask |= 1 << (ord(c) & 127)
+    return mask
+
+
+def original_score_candidates(query: str, query_mask: int, candidates: list, max_distance: int):
+    # the per-candidate loop of LengthBucketIndex.find before scoring was batched
+    results = []
+    for key, mask, order in candidates:
+        if (bin(query_mask ^ mask).count("1") + 1) // 2 <= max_distance:
+            distance = jellyfish.damerau_levenshtein_distance(query, key)
+            if distance <= max_distance:
+                results.append((distance, order, key))
+    return results
+
+
+def get_queries(rng: random.Random, keys: list, length: int):
+    # half are keys of about the right length with typos, the rest are random strings
+    near_keys = [k for k in keys if abs(len(k) - length) <= 1] or keys
+    typos = []
+    for k in rng.choices(near_keys, k=QUERIES_PER_LENGTH // 2):
+        position = rng.randrange(len(k))
+        typos.append((k[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + k[position + 1:]).ljust(length)[:length])
+    unknown = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(length))
+               for _ in range(QUERIES_PER_LENGTH - len(typos))]
+    return typos + unknown
+
+
+def measure(index: LengthBucketIndex, query_list: list, get_mask, score_candidates):
+    # returns (seconds per query, candidates per query, distance calls per query)
+    candidate_count = distance_count = 0
+    elapsed = 0
+    for q in query_list:
+        max_distance = int(matcher.get_match_threshold(q))
+        candidate_groups = [candidates for _, candidates in index._get_candidates(q, max_distance)]
+        start_time = time.perf_counter()
+        query_mask = get_mask(q)
+        for candidates in candidate_groups:
+            score_candidates(q, query_mask, candidates, max_distance)
+        elapsed += time.perf_counter() - start_time
+
+        candidate_count += sum(map(len, candidate_groups))
+        distance_count += sum(1 for candidates in candidate_groups for c in candidates
+                              if LengthBucketIndex.get_distance_lower_bound(query_mask, c[1]) <= max_distance)
+    return elapsed / len(query_list), candidate_count / len(query_list), distance_count / len(query_list)
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+matcher = Matcher()
+queries.create_queries(matcher)
+match_keys = list(matcher.match_map)
+original_index = LengthBucketIndex()
+original_index.buckets = {
+    length: [(key, original_character_mask(key), order) for key, _, order in bucket]
+    for length, bucket in matcher.match_index.buckets.items()
+}
+
+rng = random.Random(0)
+print(f"{len(match_keys)} keys, {QUERIES_PER_LENGTH} queries per length")
+print(f"{'length':<8}{'candidates':>12}{'original calls':>16}{'original (ms)':>15}{'batched calls':>15}"
+      f"{'batched (ms)':>14}")
+for length in QUERY_LENGTHS:
+    query_list = get_queries(rng, match_keys, length)
+    original = measure(original_index, query_list, original_character_mask, original_score_candidates)
+    batched = measure(matcher.match_index, query_list, LengthBucketIndex.get_character_mask,
+                      LengthBucketIndex._score_candidates)
+    print(f"{length:<8}{original[1]:>12.0f}{original[2]:>16.0f}{original[0] * 1000:>15.3f}{batched[2]:>15.0f}"
+          f"{batched[0] * 1000:>14.3f}")
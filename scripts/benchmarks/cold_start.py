@@ -0,0 +1,45 @@
+# Measures the time from startup until the first [[query]] can be answered, both when downloading all data from the
+# wiki and when loading it from the on-disk data snapshot, and with and without a saved query matcher.
+# Run from the top level of the project with the src directory on the python path:
+#     PYTHONPATH=src python scripts/benchmarks/cold_start.py [--snapshot-only]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import config
+import data
+from bot_modules import query
+
+logging.getLogger().setLevel(logging.WARNING)
+logging.basicConfig()
+
+TEST_QUERY = "gala euden"
+
+
+async def time_to_first_query(load_data, keep_saved_matcher=True):
+    if not keep_saved_matcher and os.path.exists(query.matcher_file):
+        os.remove(query.matcher_file)
+    start_time = time.perf_counter()
+    await load_data()
+    data_time = time.perf_counter() - start_time
+    await query.build_matcher()
+    query.resolve_query(TEST_QUERY)
+    return data_time, time.perf_counter() - start_time
+
+
+async def main():
+    query.query_config = config.get_global("custom_query")
+    results = []
+    if "--snapshot-only" not in sys.argv:
+        results.append(("download", await time_to_first_query(data.update_repositories, False)))
+    results.append(("snapshot", await time_to_first_query(data.load_repositories_from_snapshot, False)))
+    results.append(("snapshot, saved matcher", await time_to_first_query(data.load_repositories_from_snapshot)))
+
+    print(f"{'source':<24}{'data ready (s)':>16}{'first query (s)':>18}")
+    for source, (data_time, total_time) in results:
+        print(f"{source:<24}{data_time:>16.3f}{total_time:>18.3f}")
+
+
+asyncio.get_event_loop().run_until_complete(main())
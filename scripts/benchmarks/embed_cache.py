@@ -0,0 +1,68 @@
+# Measures the latency from receiving a [[query]] to having the payload of the message to send, over queries for the
+# entities of the data snapshot, with the embed of every query rendered from its template as before the embed cache,
+# and with the embeds recreated from the embed cache. The payload is the embed as a dict, as discord.py sends it.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/embed_cache.py
+
+import time
+import random
+import asyncio
+import logging
+import statistics
+import discord
+import config
+import data
+from bot_modules import query
+
+logging.getLogger().setLevel(logging.ERROR)
+
+QUERY_COUNT = 2000
+cached_get_match_embed = query.get_match_embed
+
+
+def original_get_match_embed(match_obj):
+    # query.get_match_embed before the embed cache
+    if isinstance(match_obj, discord.embeds.Embed):
+        return match_obj.copy()
+    return match_obj.get_embed().copy()
+
+
+def measure(query_list: list):
+    latencies = []
+    for q in query_list:
+        start_time = time.perf_counter()
+        response = query.resolve_query(q)
+        if isinstance(response, discord.Embed):
+            response.to_dict()
+        latencies.append(time.perf_counter() - start_time)
+    latencies.sort()
+    return latencies
+
+
+def describe(name: str, latencies: list):
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{name:<16}{p50:>10.3f}{p99:>10.3f}{statistics.mean(latencies) * 1000:>11.3f}")
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+query.query_config = config.get_global("custom_query")
+query.matcher = query.create_matcher()
+rng = random.Random(0)
+queries = rng.sample(sorted(str(t) for t in query.matcher.get_targets()), QUERY_COUNT)
+
+# warm the matcher's result cache, so that the measurements differ only in how the embeds are created
+query.get_match_embed = original_get_match_embed
+entity_count = len({id(query.matcher.match(q)[0]) for q in queries})
+print(f"{QUERY_COUNT} queries for {entity_count} distinct entities and embeds")
+print(f"{'':<16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mean (ms)':>11}")
+
+describe("rendered", measure(queries))
+
+query.get_match_embed = cached_get_match_embed
+query.embed_cache = {}
+describe("first shown", measure(queries))
+describe("cached", measure(queries))
+print(f"{len(query.embed_cache)} embeds cached")
@@ -0,0 +1,80 @@
+# Measures the throughput of mapping the cargo rows stored in the data snapshot to entities, comparing the compiled
+# mapping function of each EntityMapper with the generic per-row mapping loop it replaced. Post-processors aren't run,
+# since they modify entities of other tables.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/mapping.py
+
+import time
+import asyncio
+import data
+
+
+def interpreted_map_attributes(mapper: data.abc.EntityMapper, entity_data: dict):
+    # EntityMapper.map before mapping functions were compiled, without post-processing
+    inst = mapper.inst_class()
+    inst_keys = []
+
+    post_process_args = {
+        prop_name: entity_data.get(prop_name)
+        for prop_name in mapper.inst_map_arg_keys.get("_POST_PROCESS", ())
+    }
+
+    if "_SECONDARY_KEYS" in mapper.inst_map_arg_keys:
+        arg_key = mapper.inst_map_arg_keys["_SECONDARY_KEYS"][0]
+        inst_keys = mapper.inst_map_funcs["_SECONDARY_KEYS"](entity_data.get(arg_key))
+
+    for attr_name, map_func in mapper.inst_map_funcs.items():
+        if attr_name not in ("_POST_PROCESS", "_SECONDARY_KEYS"):
+            if not hasattr(inst, attr_name):
+                raise AttributeError(f"Invalid entity attribute: {attr_name}")
+
+            args = list(map(entity_data.get, mapper.inst_map_arg_keys[attr_name]))
+            if None in args:
+                invalid_key = mapper.inst_map_arg_keys[attr_name][args.index(None)]
+                raise KeyError(f"Invalid data key: {invalid_key}")
+
+            try:
+                value = map_func(*args)
+            except Exception:
+                value = None
+
+            setattr(inst, attr_name, value)
+
+    return inst, inst_keys, post_process_args
+
+
+def rows_per_second(function, rows, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for row in rows:
+            function(row)
+        best = min(best, time.perf_counter() - start_time)
+    return len(rows) / best
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+# text cleaning is memoised, so warm its cache first to measure the mapping overhead rather than the text cleaning
+for entity_type in data._snapshot.snapshot_entity_types:
+    repository = entity_type.repository
+    for row in repository.raw_data:
+        repository.entity_mapper.map_attributes(row)
+
+print(f"{'table':<18}{'rows':>6}{'interpreted':>14}{'compiled':>12}{'speedup':>9}")
+total_rows, total_interpreted, total_compiled = 0, 0, 0
+for entity_type in data._snapshot.snapshot_entity_types:
+    repository = entity_type.repository
+    mapper = repository.entity_mapper
+    rows = repository.raw_data
+    interpreted = rows_per_second(lambda row: interpreted_map_attributes(mapper, row), rows)
+    compiled = rows_per_second(mapper.map_attributes, rows)
+    print(f"{repository.table_name:<18}{len(rows):>6}{interpreted:>14,.0f}{compiled:>12,.0f}{compiled / interpreted:>8.2f}x")
+
+    total_rows += len(rows)
+    total_interpreted += len(rows) / interpreted
+    total_compiled += len(rows) / compiled
+
+print(f"{'all':<18}{total_rows:>6}{total_rows / total_interpreted:>14,.0f}{total_rows / total_compiled:>12,.0f}"
+      f"{total_interpreted / total_compiled:>8.2f}x")
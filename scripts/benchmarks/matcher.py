@@ -0,0 +1,141 @@
+# Measures the memory used by the index of each fuzzy_match.Matcher engine, and its lookup latency over the query
+# targets generated from the data snapshot, using a mix of exact targets, targets with typos, and strings which don't
+# match any target. The engines must find a match at the same distance for every query, although they may choose
+# different keys when several are equally close. The effect of the result cache is measured over a stream of queries
+# repeated with a Zipf-like distribution. The cost of finding the top 5 suggestions for the queries which don't match is
+# compared to finding only the closest one.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/matcher.py
+
+import time
+import random
+import asyncio
+import logging
+import statistics
+import tracemalloc
+import config
+import data
+from fuzzy_match import Matcher
+from bot_modules.query import queries
+
+logging.getLogger().setLevel(logging.ERROR)
+
+QUERY_COUNT = 2000
+STREAM_LENGTH = 20000
+SUGGESTION_COUNT = 5
+
+
+def add_typo(rng: random.Random, s: str):
+    position = rng.randrange(len(s))
+    operation = rng.choice(("insert", "delete", "substitute", "transpose"))
+    if operation == "insert":
+        return s[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz ") + s[position:]
+    elif operation == "delete" and len(s) > 1:
+        return s[:position] + s[position + 1:]
+    elif operation == "transpose" and position < len(s) - 1:
+        return s[:position] + s[position + 1] + s[position] + s[position + 2:]
+    return s[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz ") + s[position + 1:]
+
+
+def get_query_set(keys: list):
+    rng = random.Random(0)
+    exact = rng.sample(keys, QUERY_COUNT // 2)
+    typos = [add_typo(rng, add_typo(rng, k)) if rng.random() < 0.3 else add_typo(rng, k)
+             for k in rng.sample(keys, QUERY_COUNT // 4)]
+    unknown = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(rng.randint(3, 20)))
+               for _ in range(QUERY_COUNT // 4)]
+    return exact + typos + unknown
+
+
+def measure_latencies(matcher: Matcher, query_list: list):
+    latencies = []
+    results = []
+    for q in query_list:
+        start_time = time.perf_counter()
+        result = matcher.match(q)
+        latencies.append(time.perf_counter() - start_time)
+        results.append(result and result[2])
+    latencies.sort()
+    return latencies, results
+
+
+def measure_suggestion_latencies(matcher: Matcher, query_list: list, count: int):
+    latencies = []
+    for q in query_list:
+        start_time = time.perf_counter()
+        matcher.suggest(q, count)
+        latencies.append(time.perf_counter() - start_time)
+    latencies.sort()
+    return latencies
+
+
+def print_latencies(name: str, latencies: list, index_memory: int = None):
+    print(f"{name:<16}{percentile(latencies, 0.5) * 1000:>10.3f}{percentile(latencies, 0.99) * 1000:>10.3f}"
+          f"{statistics.mean(latencies) * 1000:>11.3f}{latencies[-1] * 1000:>10.3f}"
+          + (f"{index_memory / 1024 / 1024:>12.1f}" if index_memory is not None else ""))
+
+
+def measure_index_memory(engine: str, keys: list):
+    tracemalloc.start()
+    index = Matcher.engines[engine]()
+    for k in keys:
+        index.add(k)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory
+
+
+def percentile(sorted_values: list, fraction: float):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+matchers = {}
+for engine in Matcher.engines:
+    start_time = time.perf_counter()
+    matchers[engine] = Matcher(engine=engine)
+    queries.create_queries(matchers[engine])
+    target_count = sum(1 for _ in matchers[engine].get_targets())
+    print(f"Built {engine} matcher with {len(matchers[engine].match_map)} keys ({target_count} targets) "
+          f"in {time.perf_counter() - start_time:.2f} seconds")
+
+match_keys = list(next(iter(matchers.values())).match_map)
+query_set = get_query_set(sorted(next(iter(matchers.values())).get_targets()))
+expected = None
+print()
+print(f"{'engine':<16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mean (ms)':>11}{'max (ms)':>10}{'index (MB)':>12}")
+for engine, matcher in matchers.items():
+    latencies, results = measure_latencies(matcher, query_set)
+    if expected is None:
+        expected = results
+    elif results != expected:
+        mismatches = sum(1 for a, b in zip(results, expected) if a != b)
+        raise AssertionError(f"{engine} returned different results for {mismatches} queries")
+
+    print_latencies(engine, latencies, measure_index_memory(engine, match_keys))
+
+print()
+print(f"Lookup layers: {next(iter(matchers.values())).get_stats()}")
+
+missed_queries = [q for q, result in zip(query_set, expected) if result is None]
+print()
+print(f"Suggestions for {len(missed_queries)} queries without a match, top 1 then top {SUGGESTION_COUNT}")
+print(f"{'engine':<16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mean (ms)':>11}{'max (ms)':>10}")
+for engine, matcher in matchers.items():
+    print_latencies(engine, measure_suggestion_latencies(matcher, missed_queries, 1))
+    print_latencies("", measure_suggestion_latencies(matcher, missed_queries, SUGGESTION_COUNT))
+
+rng = random.Random(1)
+weights = [1 / (rank + 1) for rank in range(len(query_set))]
+query_stream = rng.choices(rng.sample(query_set, len(query_set)), weights, k=STREAM_LENGTH)
+cache_size = config.get_global("general")["query_cache_size"]
+print()
+print(f"Stream of {STREAM_LENGTH} queries ({len(set(query_stream))} distinct)")
+print(f"{'cache size':<16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mean (ms)':>11}{'max (ms)':>10}")
+for size in (0, cache_size):
+    matcher = Matcher(cache_size=size)
+    queries.create_queries(matcher)
+    print_latencies(str(size), measure_latencies(matcher, query_stream)[0])
+print(f"Cached matcher: {matcher.get_stats()}")
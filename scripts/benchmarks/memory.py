@@ -0,0 +1,80 @@
+# Measures the memory used by a fully loaded set of repositories, by loading the data snapshot and comparing the
+# resident set size and the traced allocations before and after. The size of the entity objects themselves (excluding
+# the values of their attributes) and the size of the duplicate string and datetime values of their attributes (equal
+# values stored as separate objects) are reported separately.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/memory.py
+
+import gc
+import sys
+import datetime
+import asyncio
+import tracemalloc
+import data
+
+
+def get_rss():
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * 4096
+
+
+def get_instance_size(entity: data.abc.Entity):
+    return sys.getsizeof(entity) + (sys.getsizeof(vars(entity)) if hasattr(entity, "__dict__") else 0)
+
+
+def get_attribute_values(entity: data.abc.Entity):
+    if hasattr(entity, "__dict__"):
+        return vars(entity).values()
+    return [getattr(entity, a) for c in type(entity).__mro__ for a in getattr(c, "__slots__", ())]
+
+
+def get_leaf_values(value):
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            yield from get_leaf_values(item)
+    elif hasattr(value, "__slots__") and not isinstance(value, data.abc.Entity):
+        for attr_name in value.__slots__:
+            yield from get_leaf_values(getattr(value, attr_name))
+    elif isinstance(value, (str, datetime.datetime)):
+        yield value
+
+
+def get_duplicate_size(values, seen_values: dict):
+    # size of the string and datetime objects which are equal to, but not the same object as, one already seen
+    duplicate_size = 0
+    for value in values:
+        for leaf in get_leaf_values(value):
+            if seen_values.setdefault(leaf, leaf) is not leaf:
+                duplicate_size += sys.getsizeof(leaf)
+    return duplicate_size
+
+
+gc.collect()
+rss_before = get_rss()
+tracemalloc.start()
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+gc.collect()
+traced, _ = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+rss_after = get_rss()
+
+print(f"{'table':<18}{'entities':>9}{'instance kB':>13}{'duplicate kB':>14}")
+total_entities, total_instance_size, total_value_size = 0, 0, 0
+all_seen_values = {}
+for entity_type in data._snapshot.snapshot_entity_types:
+    entities = {id(e): e for e in entity_type.repository.data.values()}.values()
+    instance_size = sum(map(get_instance_size, entities))
+    values = [v for e in entities for v in get_attribute_values(e)]
+    value_size = get_duplicate_size(values, {})
+    print(f"{entity_type.repository.table_name:<18}{len(entities):>9}{instance_size / 1024:>13,.0f}"
+          f"{value_size / 1024:>14,.0f}")
+    total_entities += len(entities)
+    total_instance_size += instance_size
+    total_value_size += get_duplicate_size(values, all_seen_values)
+
+print(f"{'all':<18}{total_entities:>9}{total_instance_size / 1024:>13,.0f}{total_value_size / 1024:>14,.0f}")
+print()
+print(f"Traced allocations of loaded repositories: {traced / 1024 / 1024:.2f} MB")
+print(f"Resident set size: {rss_before / 1024 / 1024:.1f} MB before loading, {rss_after / 1024 / 1024:.1f} MB after "
+      f"({(rss_after - rss_before) / 1024 / 1024:.1f} MB)")
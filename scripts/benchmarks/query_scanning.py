@@ -0,0 +1,87 @@
+# Measures the overhead that scanning for [[queries]] adds to every message, over a generated corpus of chat messages:
+# mostly messages without queries, some with brackets that aren't queries, some with one or a few queries, and long
+# messages with many queries. The original scan, which lowercased the whole message and found every query in it, is
+# compared with query.find_queries, and both must find the same queries.
+# Run from the top level of the project with the src directory on the python path:
+#     PYTHONPATH=src python scripts/benchmarks/query_scanning.py
+
+import re
+import time
+import random
+import logging
+from bot_modules import query
+
+logging.getLogger().setLevel(logging.ERROR)
+
+MESSAGE_COUNT = 100000
+REPEATS = 5
+MAX_QUERY_LEN = 45
+WORDS = ("the", "gala", "euden", "dragon", "skill", "ability", "is", "so", "good", "when", "does", "banner", "end",
+         "Agni", "Mym", "I", "think", "wyrmprint", "damage", "lol", "need", "more", "wyrmites", "for", "summons")
+
+
+def original_scan(content: str):
+    # the matching done by query.scan_for_query before find_queries, returning the queries to resolve and whether
+    # there were too many
+    if "[" in content:
+        matches = re.findall(r"\[\[(.+?)\]\]", content.lower())
+        query_list = [q for q in matches[:query.MAX_QUERIES] if len(q) <= MAX_QUERY_LEN]
+        return query_list, len(matches) > query.MAX_QUERIES
+    return [], False
+
+
+def scan(content: str):
+    # the matching done by query.scan_for_query
+    if "[[" not in content:
+        return [], False
+    matches = query.find_queries(content, query.MAX_QUERIES + 1)
+    if not matches:
+        return [], False
+    query_list = [q.lower() for q in matches[:query.MAX_QUERIES] if len(q) <= MAX_QUERY_LEN]
+    return query_list, len(matches) > query.MAX_QUERIES
+
+
+def get_sentence(rng: random.Random, word_count: int):
+    return " ".join(rng.choice(WORDS) for _ in range(word_count))
+
+
+def get_corpus(rng: random.Random):
+    kinds = (
+        ("plain", 0.88, lambda: get_sentence(rng, rng.randint(1, 30))),
+        ("brackets", 0.04, lambda: f"{get_sentence(rng, 5)} [{get_sentence(rng, 2)}](https://example.com) "
+                                   f"{get_sentence(rng, 5)}"),
+        ("queries", 0.06, lambda: " ".join(f"{get_sentence(rng, 3)} [[{get_sentence(rng, rng.randint(1, 3))}]]"
+                                           for _ in range(rng.randint(1, 3)))),
+        ("long", 0.02, lambda: " ".join(f"[[{get_sentence(rng, rng.randint(1, 12))}]] {get_sentence(rng, 10)}"
+                                        for _ in range(rng.randint(4, 30)))[:2000]),
+    )
+    corpus = {name: [] for name, _, _ in kinds}
+    for name, fraction, create_message in kinds:
+        corpus[name] = [create_message() for _ in range(int(MESSAGE_COUNT * fraction))]
+    return corpus
+
+
+def measure(scan_function, messages: list):
+    # returns the best time per message
+    best = None
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        for content in messages:
+            scan_function(content)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(messages)
+
+
+corpus = get_corpus(random.Random(0))
+all_messages = [content for messages in corpus.values() for content in messages]
+random.Random(1).shuffle(all_messages)
+for content in all_messages:
+    if original_scan(content) != scan(content):
+        raise RuntimeError(f"Scanning {content!r} found different queries")
+
+print(f"{'messages':<10}{'count':>8}{'original (us)':>15}{'scanner (us)':>14}")
+for name, messages in list(corpus.items()) + [("all", all_messages)]:
+    original = measure(original_scan, messages)
+    scanned = measure(scan, messages)
+    print(f"{name:<10}{len(messages):>8}{original * 1000000:>15.3f}{scanned * 1000000:>14.3f}")
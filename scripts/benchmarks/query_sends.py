@@ -0,0 +1,161 @@
+# Counts the Discord API calls made to respond to messages with [[queries]], by sending the responses through
+# discord.py to a local stand-in for the Discord REST API, which records each message it's sent. The responses are sent
+# one message per response as before they were coalesced, and with query.send_responses, which also combines text-only
+# embeds such as disambiguations. Both must show the same content and embeds in the same order, with consecutive
+# text-only embeds compared by the sections they're shown as in a combined embed.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/query_sends.py
+
+import json
+import time
+import types
+import random
+import asyncio
+import logging
+import discord
+import discord.http
+from aiohttp import web
+import config
+import data
+from bot_modules import query
+from bot_modules.query import queries
+
+logging.getLogger().setLevel(logging.ERROR)
+
+MESSAGE_COUNT = 200
+TEXT_QUERY_FRACTION = 0.25
+USER_DATA = {"id": "1", "username": "notte", "discriminator": "0001", "avatar": None, "bot": True}
+
+
+class StandInServer:
+    """
+    Answers the requests discord.py makes to log in and send messages, recording every message sent.
+    """
+    def __init__(self):
+        self.sent = []
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/v7/users/@me", self.get_user)
+        app.router.add_post("/api/v7/channels/{channel_id}/messages", self.create_message)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/api/v7"
+
+    @staticmethod
+    def json_response(obj):
+        # discord.py only decodes responses whose content type has no charset
+        return web.Response(body=json.dumps(obj).encode("utf-8"), content_type="application/json")
+
+    async def get_user(self, request):
+        return self.json_response(USER_DATA)
+
+    async def create_message(self, request):
+        payload = await request.json()
+        self.sent.append(payload)
+        embeds = [payload["embed"]] if payload.get("embed") else []
+        return self.json_response({
+            "id": str(len(self.sent)), "channel_id": request.match_info["channel_id"], "author": USER_DATA,
+            "content": payload.get("content") or "", "embeds": embeds, "attachments": [], "mentions": [],
+            "mention_roles": [], "mention_everyone": False, "pinned": False, "tts": False, "type": 0,
+            "timestamp": "2020-01-01T00:00:00+00:00", "edited_timestamp": None,
+        })
+
+
+async def original_send_responses(channel, responses: list):
+    # query.scan_for_query before responses were coalesced, which sent each response as its own message
+    for response in responses:
+        if isinstance(response, discord.Embed):
+            await channel.send(embed=response)
+        else:
+            await channel.send(response)
+
+
+def get_shown(sent: list):
+    # the content and embeds shown in the channel, in order, with each run of consecutive text-only embeds as the
+    # description they'd have if they were combined
+    shown = []
+    for payload in sent:
+        if payload.get("content"):
+            shown.extend(payload["content"].split("\n"))
+        if payload.get("embed"):
+            if len(payload["embed"].get("description", "")) > query.MAX_DESCRIPTION_LENGTH:
+                raise RuntimeError("Embed description is too long")
+            section = query.get_embed_section(discord.Embed.from_dict(payload["embed"]))
+            if section is None:
+                shown.append(payload["embed"])
+            elif shown and isinstance(shown[-1], tuple):
+                shown[-1] = (f"{shown[-1][0]}\n\n{section}",)
+            else:
+                shown.append((section,))
+    return shown
+
+
+def get_text_targets(targets: list):
+    # the custom queries and targets which are shown as text-only embeds, out of those which aren't entities
+    candidates = list(query.query_config["query_messages"])
+    candidates += [t for t in targets if isinstance(query.matcher.match(t)[0], (discord.Embed, queries.LazyEmbed))]
+    return [t for t in candidates if query.get_embed_section(query.resolve_query(t)) is not None]
+
+
+def get_messages(rng: random.Random, targets: list, text_targets: list):
+    misses = ["not a real thing", "qwertyuiop", "x" * 80]
+
+    def get_query():
+        if rng.random() < TEXT_QUERY_FRACTION:
+            return rng.choice(text_targets)
+        return rng.choice(targets + misses)
+
+    return [" ".join(f"[[{get_query()}]]" for _ in range(rng.choice((1, 1, 1, 2, 2, 3, 4))))
+            for _ in range(MESSAGE_COUNT)]
+
+
+async def measure(server: StandInServer, channel, messages: list, send_responses):
+    # returns (API calls, seconds, content and embeds shown) for responding to every message
+    query.send_responses = send_responses
+    server.sent = []
+    start_time = time.perf_counter()
+    for content in messages:
+        await query.scan_for_query(types.SimpleNamespace(content=content, channel=channel, guild=None))
+    return len(server.sent), time.perf_counter() - start_time, get_shown(server.sent)
+
+
+async def main():
+    if not await data.load_repositories_from_snapshot():
+        raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+    query.query_config = config.get_global("custom_query")
+    query.matcher = query.create_matcher()
+    targets = sorted(str(t) for t in query.matcher.get_targets())
+    text_targets = get_text_targets(targets)
+    messages = get_messages(random.Random(0), targets, text_targets)
+
+    server = StandInServer()
+    await server.start()
+    discord.http.Route.BASE = server.url
+    client = discord.Client()
+    await client.http.static_login("token", bot=True)
+    me = discord.ClientUser(state=client._connection, data=USER_DATA)
+    channel = discord.DMChannel(me=me, state=client._connection, data={"id": "2", "recipients": [USER_DATA]})
+
+    coalesced_send_responses = query.send_responses
+    original = await measure(server, channel, messages, original_send_responses)
+    coalesced = await measure(server, channel, messages, coalesced_send_responses)
+    if original[2] != coalesced[2]:
+        raise RuntimeError("Coalesced responses show different content")
+
+    print(f"{MESSAGE_COUNT} messages with {sum(m.count('[[') for m in messages)} queries, "
+          f"{TEXT_QUERY_FRACTION:.0%} of them for one of {len(text_targets)} text-only results")
+    print(f"{'':<12}{'API calls':>10}{'per message':>13}{'total (ms)':>12}")
+    for name, (calls, elapsed, _) in (("original", original), ("coalesced", coalesced)):
+        print(f"{name:<12}{calls:>10}{calls / MESSAGE_COUNT:>13.2f}{elapsed * 1000:>12.1f}")
+
+    await client.http.close()
+    await server.runner.cleanup()
+
+
+asyncio.get_event_loop().run_until_complete(main())
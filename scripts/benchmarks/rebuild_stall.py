@@ -0,0 +1,60 @@
+# Measures how long the event loop is stalled while the matchers are rebuilt after a data update, comparing rebuilding
+# them on the event loop with rebuilding them in the background worker thread. A ticker coroutine stands in for message
+# handling, and records how late each of its ticks runs.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/rebuild_stall.py
+
+import time
+import asyncio
+import logging
+import data
+from bot_modules import query, ability_reverse_search
+from bot_modules.summon_sim import core
+
+logging.getLogger().setLevel(logging.ERROR)
+
+TICK_INTERVAL = 0.01
+
+
+async def measure_ticks(latenesses: list):
+    while True:
+        expected_time = time.perf_counter() + TICK_INTERVAL
+        await asyncio.sleep(TICK_INTERVAL)
+        latenesses.append(time.perf_counter() - expected_time)
+
+
+async def rebuild_on_event_loop():
+    query.matcher = query.create_matcher()
+    ability_reverse_search.matcher = ability_reverse_search.create_matcher()
+    core.SimShowcaseCache.default_showcase, core.SimShowcaseCache.showcases, core.SimShowcaseCache.showcase_matcher = \
+        core.SimShowcaseCache.create_data()
+
+
+async def rebuild_in_background():
+    await asyncio.gather(query.build_matcher(), ability_reverse_search.build_matcher(), core.SimShowcaseCache.update_data())
+
+
+async def measure(rebuild):
+    latenesses = []
+    ticker = asyncio.ensure_future(measure_ticks(latenesses))
+    await asyncio.sleep(0.05)
+    start_time = time.perf_counter()
+    await rebuild()
+    rebuild_time = time.perf_counter() - start_time
+    await asyncio.sleep(0.05)
+    ticker.cancel()
+    latenesses.sort()
+    return rebuild_time, latenesses[len(latenesses) // 2], latenesses[int(len(latenesses) * 0.99)], latenesses[-1]
+
+
+async def main():
+    if not await data.load_repositories_from_snapshot():
+        raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+    print(f"{'rebuild':<14}{'time (s)':>10}{'p50 stall (ms)':>16}{'p99 stall (ms)':>16}{'max stall (ms)':>16}")
+    for name, rebuild in (("event loop", rebuild_on_event_loop), ("background", rebuild_in_background)):
+        rebuild_time, p50, p99, max_stall = await measure(rebuild)
+        print(f"{name:<14}{rebuild_time:>10.2f}{p50 * 1000:>16.1f}{p99 * 1000:>16.1f}{max_stall * 1000:>16.1f}")
+
+
+asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,81 @@
+# Measures the cost of the embed templates: loading every template at startup, by compiling it from its source and by
+# loading it from the bytecode cache, and rendering the embed content of every adventurer, dragon, weapon and wyrmprint
+# in the data snapshot, by looking each template up when it's rendered as before the templates were loaded at startup,
+# and from the loaded templates.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/template_rendering.py
+
+import time
+import asyncio
+import logging
+import data
+from data.abc import EmbedContentGenerator
+
+logging.getLogger().setLevel(logging.ERROR)
+
+REPEATS = 5
+RENDERED_TYPES = {
+    "adventurer": data.Adventurer,
+    "dragon": data.Dragon,
+    "weapon": data.Weapon,
+    "wyrmprint": data.Wyrmprint,
+}
+
+
+def original_get_embed_content(template_name: str, **kwargs):
+    # EmbedContentGenerator.get_embed_content before templates were loaded at startup
+    rendered = EmbedContentGenerator.env.get_template(f"{template_name}.j2").render(**kwargs)
+    return tuple(rendered.split("\n", maxsplit=1))
+
+
+def measure_loading(bytecode_cache):
+    # returns the best time to load every template into a new environment using the given bytecode cache
+    best = None
+    for _ in range(REPEATS):
+        EmbedContentGenerator.env = EmbedContentGenerator.env.overlay(bytecode_cache=bytecode_cache)
+        start_time = time.perf_counter()
+        EmbedContentGenerator.load_templates()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_rendering(get_embed_content, entities: list):
+    # returns the best time to render the embed content of every entity
+    best = None
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        for template_name, e in entities:
+            get_embed_content(template_name, e=e)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+base_env = EmbedContentGenerator.env
+compile_time = measure_loading(None)
+bytecode_time = measure_loading(base_env.bytecode_cache)
+EmbedContentGenerator.env = base_env
+EmbedContentGenerator.load_templates()
+template_count = len(EmbedContentGenerator.templates)
+print(f"Loading {template_count} templates: {compile_time * 1000:.1f} ms compiling from source, "
+      f"{bytecode_time * 1000:.1f} ms from the bytecode cache")
+
+rendered_entities = [(name, e) for name, entity_type in RENDERED_TYPES.items() for e in entity_type.repository.entities]
+for name, entity_type in RENDERED_TYPES.items():
+    entities = [(name, e) for e in entity_type.repository.entities]
+    for template_name, e in entities:
+        rendered = EmbedContentGenerator.get_embed_content(template_name, e=e)
+        if original_get_embed_content(template_name, e=e) != rendered:
+            raise RuntimeError(f"Rendering {template_name} {e} differs")
+
+print(f"{'template':<12}{'entities':>10}{'looked up (ms)':>16}{'loaded (ms)':>13}{'per embed (us)':>16}")
+for name, entity_type in list(RENDERED_TYPES.items()) + [("all", None)]:
+    entities = [(t, e) for t, e in rendered_entities if name in ("all", t)]
+    looked_up = measure_rendering(original_get_embed_content, entities)
+    loaded = measure_rendering(EmbedContentGenerator.get_embed_content, entities)
+    print(f"{name:<12}{len(entities):>10}{looked_up * 1000:>16.1f}{loaded * 1000:>13.1f}"
+          f"{loaded / len(entities) * 1000000:>16.1f}")
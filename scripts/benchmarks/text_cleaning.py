@@ -0,0 +1,57 @@
+# Measures the throughput of EntityMapper.text over the text fields of the cargo rows stored in the data snapshot, and
+# the throughput of mapping every row of each table.
+# Run from the top level of the project with the src directory on the python path, after the bot has saved a snapshot:
+#     PYTHONPATH=src python scripts/benchmarks/text_cleaning.py
+
+import re
+import time
+import asyncio
+import data
+
+mf = data.abc.EntityMapper
+
+
+def original_text(s: str):
+    # EntityMapper.text before the markup check and memoisation were added
+    spaces_reduced = re.sub(r" {2,}", " ", mf.strip_markup(s))
+    return spaces_reduced.strip() or None
+
+
+def time_per_call(function, args):
+    start_time = time.perf_counter()
+    for arg in args:
+        function(arg)
+    return (time.perf_counter() - start_time) / len(args)
+
+
+if not asyncio.get_event_loop().run_until_complete(data.load_repositories_from_snapshot()):
+    raise RuntimeError("No usable data snapshot, run the bot or scripts/benchmarks/cold_start.py first")
+
+entity_types = data._snapshot.snapshot_entity_types
+text_values = []
+for entity_type in entity_types:
+    mapper = entity_type.repository.entity_mapper
+    text_fields = [mapper.inst_map_arg_keys[a][0] for a, f in mapper.inst_map_funcs.items() if f is mf.text]
+    text_values += [row[field] for row in entity_type.repository.raw_data for field in text_fields]
+
+markup_count = sum(1 for s in text_values if mf.markup_pattern.search(s))
+print(f"{len(text_values)} text values, {markup_count} containing markup, {len(set(text_values))} distinct")
+
+mf.text.cache_clear()
+results = [
+    ("original", time_per_call(original_text, text_values)),
+    ("markup check", time_per_call(mf.text.__wrapped__, text_values)),
+    ("memoised, cold", time_per_call(mf.text, text_values)),
+    ("memoised, warm", time_per_call(mf.text, text_values)),
+]
+print(f"{'text':<16}{'us/value':>10}{'values/s':>12}")
+for name, seconds in results:
+    print(f"{name:<16}{seconds * 1e6:>10.2f}{1 / seconds:>12,.0f}")
+
+print()
+print(f"{'table':<18}{'rows':>6}{'rows/s':>12}")
+mf.text.cache_clear()
+for entity_type in entity_types:
+    repository = entity_type.repository
+    seconds = time_per_call(repository.entity_mapper.map, repository.raw_data)
+    print(f"{repository.table_name:<18}{len(repository.raw_data):>6}{1 / seconds:>12,.0f}")
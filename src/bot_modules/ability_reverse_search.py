@@ -12,7 +12,7 @@ matcher: Matcher = None
 
 
 async def on_init(discord_client):
-    build_matcher()
+    await build_matcher()
 
     hook.Hook.get("public!printswith").attach(wyrmprint_lookup)
     hook.Hook.get("data_downloaded").attach(build_matcher)
@@ -37,8 +37,20 @@ async def wyrmprint_lookup(message, args):
         await message.channel.send("I don't know any wyrmprints that have an ability like that!")
 
 
-def build_matcher():
+async def build_matcher():
+    """
+    Builds a new wyrmprint ability matcher from the current data in the background, then replaces the current one with
+    it.
+    """
     global matcher
+    matcher = await util.run_in_background(create_matcher, "Built wyrmprint ability matcher")
+
+
+def create_matcher() -> Matcher:
+    """
+    Creates a matcher of wyrmprint ability types from the current data.
+    :return: the new matcher
+    """
     logger.info("Generating queries...")
     new_matcher = Matcher()
 
@@ -57,8 +69,8 @@ def build_matcher():
     for gen_name, index in wyrmprint_ability_index.items():
         new_matcher.add(gen_name, index)
 
-    matcher = new_matcher
-    logger.info(f"{len(matcher.match_map)} queries generated")
+    logger.info(f"{len(new_matcher.match_map)} queries generated")
+    return new_matcher
 
 
 hook.Hook.get("on_init").attach(on_init)
@@ -65,7 +65,11 @@ def get_reset_message(date: datetime.datetime):
     def get_days_until_datetime(utc_datetime):
         return round((utc_datetime - date).total_seconds() / 86400)
 
-    showcase_list = list(filter(lambda s: get_days_until_datetime(s.end_date) == 1, data.Showcase.get_all()))
+    # only showcases ending between half a day and a day and a half from now can round to one day
+    ending_showcases = data.Showcase.repository.where_between(
+        "end_date", date + datetime.timedelta(days=0.5), date + datetime.timedelta(days=1.5)
+    )
+    showcase_list = list(filter(lambda s: get_days_until_datetime(s.end_date) == 1, ending_showcases))
     if showcase_list:
         showcase_list_str = util.readable_list(list(map(lambda s: s.name or "Unnamed", showcase_list)))
         message_lines.append(f"Today is the last day of the {showcase_list_str} summon showcase{'s' if len(showcase_list) > 1 else ''}!")
@@ -35,9 +35,8 @@ async def update_gift_string():
         gift = data.DragonGift(reset_day + 1)
 
         dragons = [
-            d for d in data.Dragon.get_all() if
-            d.favourite_gift == gift
-            and d.rarity
+            d for d in data.Dragon.repository.where(favourite_gift=gift) if
+            d.rarity
             and d.release_date
             and d.release_date <= datetime.datetime.now(datetime.timezone.utc)
         ]
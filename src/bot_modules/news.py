@@ -10,6 +10,7 @@ import html.parser
 import re
 import math
 import hook
+import http_cache
 
 logger = logging.getLogger(__name__)
 
@@ -223,18 +224,17 @@ def get_news_embed(article_title, article_url, content_sections, is_update):
 
 
 async def get_api_json_response(session: aiohttp.ClientSession, url: str):
-    async with session.get(url) as response:
-        try:
-            response_json = await response.json(content_type=None)
-        except json.decoder.JSONDecodeError:
-            logger.warning("Could not decode JSON response")
-            return None
-
-        if response_json["data_headers"]["result_code"] != 1:
-            logger.error("Error performing query, data_headers = " + json.dumps(response_json["data_headers"]))
-            return None
-
-        return response_json
+    try:
+        response_json = json.loads(await http_cache.cache.get(session, url))
+    except json.decoder.JSONDecodeError:
+        logger.warning("Could not decode JSON response")
+        return None
+
+    if response_json["data_headers"]["result_code"] != 1:
+        logger.error("Error performing query, data_headers = " + json.dumps(response_json["data_headers"]))
+        return None
+
+    return response_json
 
 
 def get_html_content(article_json):
@@ -4,6 +4,7 @@ import json
 import util
 import data
 import hook
+import http_cache
 
 client: discord.Client = None
 
@@ -20,6 +21,7 @@ async def on_init(discord_client):
     hook.Hook.get("owner!update_data").attach(update_data)
     hook.Hook.get("owner!wc_set").attach(wconfig_set)
     hook.Hook.get("owner!wc_del").attach(wconfig_del)
+    hook.Hook.get("owner!cache_stats").attach(cache_stats)
 
 
 async def say(message, args):
@@ -70,6 +72,10 @@ async def update_data(message, args):
         await message.channel.send("Updated data successfully.")
 
 
+async def cache_stats(message, args):
+    await message.channel.send(f"**HTTP cache:** {http_cache.cache.get_stats()}")
+
+
 async def wconfig_set(message, args):
     key = args.split(" ")[0]
     try:
@@ -1,92 +1,299 @@
 import re
+import pickle
+import data
 import discord
 import urllib.parse
 import hook
+import itertools
 import logging
 import config
-import time
+import util
 from . import queries
 from fuzzy_match import Matcher
 
 logger = logging.getLogger(__name__)
 
 matcher: Matcher = None
+# maps the entity type name and key of each entity embed shown since the matcher was built to the embed as a dict. It's
+# replaced along with the matcher, so it only holds embeds of the data generation the matcher was created from.
+embed_cache = {}
 query_config = None
+query_pattern = re.compile(r"\[\[(.+?)\]\]")
+MAX_QUERIES = 3
+# the description length limit of the Discord API version discord.py uses, which limits how many embeds can be combined
+MAX_DESCRIPTION_LENGTH = 2048
+# the keys of embeds as dicts which have no more than a title, description, colour and footer text
+TEXT_EMBED_KEYS = {"type", "title", "description", "color", "footer"}
+matcher_file = util.path("data/query_matcher.pickle")
 
 
 async def on_init(discord_client):
     global query_config
     query_config = config.get_global("custom_query")
 
-    build_matcher()
+    await build_matcher()
 
     hook.Hook.get("on_message").attach(scan_for_query)
     hook.Hook.get("data_downloaded").attach(build_matcher)
+    hook.Hook.get("owner!cache_stats").attach(matcher_stats)
 
 
 async def scan_for_query(message):
-    if "[" in message.content:
-        matches = re.findall(r"\[\[(.+?)\]\]", message.content.lower())
-        if len(matches) > 0:
-            if len(matches) > 3:
-                await message.channel.send("Too many queries, only the first three will be shown.")
+    if "[[" not in message.content:
+        return
 
-            is_special_guild = message.guild and message.guild.id in query_config["special_guilds"]
-            for raw_match in matches[:3]:
-                if len(raw_match) > matcher.max_query_len + 5:
-                    await message.channel.send("That's way too much, I'm not looking for that!")
-                    continue
+    matches = find_queries(message.content, MAX_QUERIES + 1)
+    if len(matches) > 0:
+        responses = []
+        if len(matches) > MAX_QUERIES:
+            responses.append("Too many queries, only the first three will be shown.")
 
-                response = resolve_query(raw_match, is_special_guild)
-                if isinstance(response, discord.Embed):
-                    await message.channel.send(embed=response)
-                else:
-                    await message.channel.send(response)
+        is_special_guild = message.guild and message.guild.id in query_config["special_guilds"]
+        max_len = matcher.max_query_len + 5
+        query_list = [q.lower() for q in matches[:MAX_QUERIES] if len(q) <= max_len]
+        query_responses = iter(resolve_queries(query_list, is_special_guild))
+        for raw_match in matches[:MAX_QUERIES]:
+            if len(raw_match) > max_len:
+                responses.append("That's way too much, I'm not looking for that!")
+            else:
+                responses.append(next(query_responses))
+
+        await send_responses(message.channel, responses)
+
+
+async def send_responses(channel, responses: list):
+    """
+    Sends query responses in as few messages as possible. A message can only have one embed, so consecutive text-only
+    embeds are combined into one where they fit, then each embed is sent with the text responses before it as the
+    message content, and the text responses after the last embed are sent together.
+    :param channel: channel to send the responses in
+    :param responses: list of embeds and messages, in the order they should be shown
+    """
+    lines = []
+    for response in combine_text_embeds(responses):
+        if isinstance(response, discord.Embed):
+            await channel.send("\n".join(lines) or None, embed=response)
+            lines = []
+        else:
+            lines.append(response)
+
+    if lines:
+        await channel.send("\n".join(lines))
+
+
+def combine_text_embeds(responses: list) -> list:
+    """
+    Combines consecutive embeds that only have text, such as disambiguations, into one embed with a section of its
+    description for each, as long as the description stays within the length limit.
+    :param responses: list of embeds and messages, in the order they should be shown
+    :return: the responses, with each run of text-only embeds that fit in one embed replaced by the combined embed
+    """
+    combined = []
+    run = []  # text-only embeds not yet added to the combined responses, and their sections
+    for response in responses:
+        section = get_embed_section(response) if isinstance(response, discord.Embed) else None
+        if run and (section is None or sum(len(s) + 2 for _, s in run) + len(section) > MAX_DESCRIPTION_LENGTH):
+            combined.append(combine_run(run))
+            run = []
+        if section is None:
+            combined.append(response)
+        else:
+            run.append((response, section))
+
+    if run:
+        combined.append(combine_run(run))
+    return combined
+
+
+def combine_run(run: list) -> discord.Embed:
+    """
+    :param run: list of text-only embeds and their sections
+    :return: the embed if there's only one, else an embed with the sections as its description
+    """
+    if len(run) == 1:
+        return run[0][0]
+    colour = next((e.colour for e, _ in run if e.colour), discord.Embed.Empty)
+    return discord.Embed(description="\n\n".join(section for _, section in run), colour=colour)
+
+
+def get_embed_section(embed: discord.Embed):
+    """
+    :param embed: embed to show as part of another embed's description
+    :return: the title, description and footer text of the embed as markdown, or None if the embed has anything else
+    """
+    embed_dict = embed.to_dict()
+    if not embed_dict.keys() <= TEXT_EMBED_KEYS or not embed_dict.get("footer", {}).keys() <= {"text"}:
+        return None
+
+    lines = []
+    if embed.title:
+        lines.append(f"**{discord.utils.escape_markdown(embed.title)}**")
+    if embed.description:
+        lines.append(embed.description)
+    if embed.footer.text:
+        lines.append(f"*{discord.utils.escape_markdown(embed.footer.text)}*")
+    return "\n".join(lines)
+
+
+def find_queries(content: str, max_count: int) -> list:
+    """
+    Finds the [[queries]] in a message, without searching the rest of the message once enough have been found.
+    :param content: content of the message
+    :param max_count: maximum number of queries to find
+    :return: list of the text of each query, in its original case
+    """
+    if content.count("[[") <= max_count:
+        # there can't be too many queries, and finding them all at once is faster
+        return query_pattern.findall(content)
+    return [m.group(1) for m in itertools.islice(query_pattern.finditer(content), max_count)]
+
+
+async def matcher_stats(message, args):
+    """
+    Shows the query cache hit rate, how many query lookups each matching layer has resolved, and how many entity embeds
+    are cached, since the query matcher was last built.
+    """
+    await message.channel.send(f"**Query matcher:** {matcher.get_stats()}, {len(embed_cache)} embeds cached")
 
 
 def resolve_query(query: str, include_special_responses=False):
+    return resolve_queries([query], include_special_responses)[0]
+
+
+def resolve_queries(query_list: list, include_special_responses=False):
+    """
+    Resolves several queries, matching those without a custom query message together.
+    :param query_list: queries to resolve
+    :param include_special_responses: whether to use the special query messages
+    :return: list of the response to each query, either an embed or a message
+    """
     special_query_messages = query_config["special_query_messages"]
     regular_query_messages = query_config["query_messages"]
-    search_term = query.lower()
-    embed = None
+    search_terms = [q.lower() for q in query_list]
 
     # resolve custom query messages
-    custom_query = None
-    if search_term in special_query_messages and include_special_responses:
-        custom_query = special_query_messages[search_term]
-    elif search_term in regular_query_messages:
-        custom_query = regular_query_messages[search_term]
+    custom_queries = {}
+    for search_term in search_terms:
+        if search_term in special_query_messages and include_special_responses:
+            custom_queries[search_term] = special_query_messages[search_term]
+        elif search_term in regular_query_messages:
+            custom_queries[search_term] = regular_query_messages[search_term]
+
+    matched_terms = [t for t in search_terms if t not in custom_queries]
+    match_contents = dict(zip(matched_terms, matcher.match_many(matched_terms)))
+    return [get_response(q, custom_queries.get(t), match_contents.get(t)) for q, t in zip(query_list, search_terms)]
+
 
+def get_response(query: str, custom_query, match_content):
+    """
+    :param query: query being resolved
+    :param custom_query: custom query message for the query, or None
+    :param match_content: result of matching the query, or None
+    :return: an embed of the custom query message or match, or a message with suggestions if there's neither
+    """
+    embed = None
     if custom_query:
         title, content = custom_query
         if urllib.parse.urlparse(content).scheme:
             embed = discord.Embed(title=title).set_image(url=content)
         else:
             embed = discord.Embed(title=title, description=content)
-    else:
-        match_content = matcher.match(search_term)
-        if match_content:
-            match_obj = match_content[0]
-            if isinstance(match_obj, discord.embeds.Embed):
-                embed = match_obj.copy()
-            else:
-                embed = match_obj.get_embed().copy()
+    elif match_content:
+        embed = get_match_embed(match_content[0])
+        if match_content[2] < 1:
+            embed.set_footer(text=f'Displaying result for "{match_content[1]}"')
+
+    if embed:
+        return embed
+
+    suggestions = matcher.suggest(query, config.get_global("general")["query_suggestion_count"])
+    if suggestions:
+        suggestion_list = ", ".join(f'"{s}"' for s in suggestions)
+        return f"I'm not sure what \"{query}\" is. Did you mean {suggestion_list}?"
+    return f"I'm not sure what \"{query}\" is."
+
 
-            if match_content[2] < 1:
-                embed.set_footer(text=f'Displaying result for "{match_content[1]}"')
+def get_match_embed(match_obj) -> discord.Embed:
+    """
+    Gets the embed for the result of a query match. Entity embeds are rendered the first time they're shown, and
+    recreated from the embed cache after that.
+    :param match_obj: entity, embed or lazy embed that a query matched
+    :return: a new embed, whose footer may be changed without affecting the cached embed
+    """
+    if isinstance(match_obj, discord.Embed):
+        return match_obj.copy()
+    elif isinstance(match_obj, queries.LazyEmbed):
+        return match_obj.get_embed()
 
-    return embed or f"I'm not sure what \"{query}\" is."
+    cache_key = type(match_obj).__name__, match_obj.get_key()
+    embed_dict = embed_cache.get(cache_key)
+    if embed_dict is None:
+        embed_dict = embed_cache[cache_key] = match_obj.get_embed().to_dict()
+    return discord.Embed.from_dict(embed_dict)
 
 
-def build_matcher():
-    global matcher
+async def build_matcher():
+    """
+    Builds a new query matcher from the current data in the background, then replaces the current one with it, and
+    clears the embed cache.
+    """
+    global matcher, embed_cache
+    new_matcher = await util.run_in_background(create_matcher, "Built query matcher")
+    matcher, embed_cache = new_matcher, {}
+
+
+def create_matcher() -> Matcher:
+    """
+    Creates a query matcher from the current data.
+    :return: the new matcher
+    """
+    cache_size = config.get_global("general")["query_cache_size"]
+    inputs_hash = queries.get_inputs_hash()
+    new_matcher = Matcher.load(matcher_file, inputs_hash, resolve_result_reference, cache_size=cache_size)
+    if new_matcher:
+        logger.info(f"Loaded {sum(1 for _ in new_matcher.get_targets())} queries from saved matcher")
+        return new_matcher
+
     logger.info("Generating queries...")
-    start_time = time.perf_counter()
-    new_matcher = Matcher()
+    new_matcher = Matcher(cache_size=cache_size)
     queries.create_queries(new_matcher)
-    matcher = new_matcher
-    logger.info(f"{len(matcher.match_map)} queries generated in {time.perf_counter() - start_time:.1f} seconds")
-    logger.info(f"Determined maximum query length {matcher.max_query_len}")
+    logger.info(f"{sum(1 for _ in new_matcher.get_targets())} queries generated, "
+                f"{len(new_matcher.match_map)} of them without a suffix")
+    logger.info(f"Determined maximum query length {new_matcher.max_query_len}")
+
+    # noinspection PyBroadException
+    try:
+        new_matcher.save(matcher_file, inputs_hash, get_result_reference)
+    except Exception:
+        logger.exception("Could not save query matcher:")
+    return new_matcher
+
+
+def get_result_reference(obj):
+    """
+    :param obj: object being saved with the query matcher
+    :return: a reference to the object if it's an entity or the empty embed value, which must not be copied, else None
+    """
+    if isinstance(obj, data.abc.Entity):
+        return type(obj).__name__, obj.get_key()
+    elif obj is discord.Embed.Empty:
+        return "Embed.Empty"
+    return None
+
+
+def resolve_result_reference(reference):
+    """
+    :param reference: reference created by get_result_reference
+    :return: the referenced object
+    """
+    if reference == "Embed.Empty":
+        return discord.Embed.Empty
+
+    entity_type_name, key = reference
+    entity = getattr(data, entity_type_name).repository.get_from_key(key)
+    if entity is None:
+        raise pickle.UnpicklingError(f"{entity_type_name} {key} no longer exists")
+    return entity
 
 
 hook.Hook.get("on_init").attach(on_init)
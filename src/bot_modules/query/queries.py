@@ -1,7 +1,12 @@
+import os
+import json
+import hashlib
 import data
 import typing
 import config
+import util
 import collections
+import itertools
 import natsort
 import discord
 import logging
@@ -9,6 +14,59 @@ from fuzzy_match import Matcher
 
 logger = logging.getLogger(__name__)
 
+# increment when the queries created from the same data and configs change
+QUERIES_VERSION = 3
+
+
+class LazyEmbed:
+    """
+    A query result embed which is only created when it's first shown, for results which are derived from entities
+    rather than being the embed of an entity.
+    """
+    __slots__ = ("create_embed", "args", "embed_dict")
+
+    def __init__(self, create_embed: typing.Callable, *args):
+        """
+        :param create_embed: function returning the embed, which must be picklable to save the query matcher
+        :param args: arguments to call the function with
+        """
+        self.create_embed = create_embed
+        self.args = args
+        self.embed_dict = None
+
+    def get_embed(self) -> discord.Embed:
+        """
+        :return: a new copy of the embed, which is created on the first call
+        """
+        if self.embed_dict is None:
+            self.embed_dict = self.create_embed(*self.args).to_dict()
+        return discord.Embed.from_dict(self.embed_dict)
+
+    def __getstate__(self):
+        # the created embed isn't saved, as the data it was created from may be changed by the time it's loaded
+        return self.create_embed, self.args
+
+    def __setstate__(self, state):
+        self.create_embed, self.args = state
+        self.embed_dict = None
+
+
+def get_inputs_hash() -> str:
+    """
+    Creates a hash of everything that the queries are created from: the data, the alias and ability disambiguation
+    configs, and the version of the query creation.
+    :return: hash of the query inputs
+    """
+    config_names = ["ability_disambiguation"] + sorted(
+        f"query_alias/{os.path.splitext(file_name)[0]}" for file_name in os.listdir(util.path("config/query_alias"))
+    )
+    inputs = {
+        "version": QUERIES_VERSION,
+        "data": data.get_data_hash(),
+        "configs": {name: config.get_global(name) for name in config_names},
+    }
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
 
 def create_queries(matcher: Matcher):
     add_query = matcher.add
@@ -50,35 +108,35 @@ def create_adventurer_queries(add_query: typing.Callable):
         add_query(name, a)
         has_shared_skill = False
         if a.skill_1:
-            add_query(f"{name} s1", a.skill_1)
+            add_query(name, a.skill_1, suffix="s1")
             if a.skill_1.share_cost:
-                add_query(f"{name} ss", a.skill_1)
+                add_query(name, a.skill_1, suffix="ss")
                 has_shared_skill = True
         if a.skill_2:
-            add_query(f"{name} s2", a.skill_2)
+            add_query(name, a.skill_2, suffix="s2")
             if a.skill_2.share_cost:
-                add_query(f"{name} ss", a.skill_2)
+                add_query(name, a.skill_2, suffix="ss")
                 has_shared_skill = True
         if not has_shared_skill:
-            add_query(f"{name} ss", discord.Embed(description=f"{a.full_name} doesn't have a shared skill."))
+            add_query(name, discord.Embed(description=f"{a.full_name} doesn't have a shared skill."), suffix="ss")
         if a.ability_1:
-            add_query(f"{name} a1", a.ability_1[-1])
+            add_query(name, a.ability_1[-1], suffix="a1")
         if a.ability_2:
-            add_query(f"{name} a2", a.ability_2[-1])
+            add_query(name, a.ability_2[-1], suffix="a2")
         if a.ability_3:
-            add_query(f"{name} a3", a.ability_3[-1])
+            add_query(name, a.ability_3[-1], suffix="a3")
         if a.coability:
             coab = a.coability[-1]
-            add_query(f"{name} coability", coab)
-            add_query(f"{name} coab", coab)
-            add_query(f"{name} ca", coab)
+            add_query(name, coab, suffix="coability")
+            add_query(name, coab, suffix="coab")
+            add_query(name, coab, suffix="ca")
         if a.chain_coability:
             cc = a.chain_coability[-1]
-            add_query(f"{name} chain coability", cc)
-            add_query(f"{name} chain coab", cc)
-            add_query(f"{name} chain", cc)
-            add_query(f"{name} cca", cc)
-            add_query(f"{name} cc", cc)
+            add_query(name, cc, suffix="chain coability")
+            add_query(name, cc, suffix="chain coab")
+            add_query(name, cc, suffix="chain")
+            add_query(name, cc, suffix="cca")
+            add_query(name, cc, suffix="cc")
 
 
 def create_dragon_queries(add_query: typing.Callable):
@@ -86,17 +144,17 @@ def create_dragon_queries(add_query: typing.Callable):
     for name, d in dragons.items():
         add_query(name, d)
         if d.skill:
-            add_query(f"{name} skill", d.skill)
-            add_query(f"{name} s1", d.skill)
+            add_query(name, d.skill, suffix="skill")
+            add_query(name, d.skill, suffix="s1")
         if d.ability_1:
-            add_query(f"{name} ability", d.ability_1[-1])
-            add_query(f"{name} a1", d.ability_1[-1])
+            add_query(name, d.ability_1[-1], suffix="ability")
+            add_query(name, d.ability_1[-1], suffix="a1")
         if d.ability_2:
-            add_query(f"{name} a2", d.ability_2[-1])
+            add_query(name, d.ability_2[-1], suffix="a2")
         if d.ability_1 or d.ability_2:
-            e = d.get_abilities_embed()
-            add_query(f"{name} abilities", e)
-            add_query(f"{name} aura", e)
+            e = LazyEmbed(d.get_abilities_embed)
+            add_query(name, e, suffix="abilities")
+            add_query(name, e, suffix="aura")
 
 
 def create_wyrmprint_queries(add_query: typing.Callable):
@@ -109,11 +167,11 @@ def create_wyrmprint_queries(add_query: typing.Callable):
         for name in names:
             add_query(name, wp)
             if wp.ability_1:
-                add_query(f"{name} a1", wp.ability_1[-1])
+                add_query(name, wp.ability_1[-1], suffix="a1")
             if wp.ability_2:
-                add_query(f"{name} a2", wp.ability_2[-1])
+                add_query(name, wp.ability_2[-1], suffix="a2")
             if wp.ability_3:
-                add_query(f"{name} a3", wp.ability_3[-1])
+                add_query(name, wp.ability_3[-1], suffix="a3")
 
 
 def create_weapon_queries(add_query: typing.Callable):
@@ -141,12 +199,12 @@ def create_weapon_queries(add_query: typing.Callable):
         for desc in descriptions:
             add_query(desc, w)
             if w.skill:
-                add_query(f"{desc} skill", w.skill)
-                add_query(f"{desc} s1", w.skill)
+                add_query(desc, w.skill, suffix="skill")
+                add_query(desc, w.skill, suffix="s1")
             if w.ability_1:
-                add_query(f"{desc} a1", w.ability_1[-1])
+                add_query(desc, w.ability_1[-1], suffix="a1")
             if w.ability_2:
-                add_query(f"{desc} a2", w.ability_2[-1])
+                add_query(desc, w.ability_2[-1], suffix="a2")
 
 
 def create_skill_queries(add_query: typing.Callable):
@@ -164,12 +222,12 @@ def create_ability_queries(add_query: typing.Callable):
         generic_ability_group_map[ab.generic_name].append(ab)
 
     generic_ability_sources_map = collections.defaultdict(dict)
-    entities = [item for sublist in map(lambda c: c.get_all(), (
+    entities = itertools.chain.from_iterable(c.repository.entities for c in (
         data.Adventurer,
         data.Dragon,
         data.Wyrmprint,
         data.Weapon
-    )) for item in sublist]
+    ))
 
     for ent in entities:
         # assumes that abilities unique to an entity won't be present on that entity in multiple slots
@@ -196,18 +254,26 @@ def create_ability_queries(add_query: typing.Callable):
                     desc = ""
                     logger.warning(f"No description for common generic ability {gen_name}")
 
-                names = natsort.natsorted(set(ab.name for ab in ab_list), reverse=True)
-                if len(names) > 15:
-                    names = names[:15] + ["..."]
+                add_query(gen_name, LazyEmbed(create_disambiguation_embed, gen_name, desc, ab_list))
+
 
-                name_list = "\n".join(names)
-                embed = discord.Embed(
-                    title=f"{gen_name} (Disambiguation)",
-                    description=f"{desc}\n\n{name_list}".strip(),
-                    color=0xFF7000
-                )
+def create_disambiguation_embed(generic_name: str, description: str, abilities: list) -> discord.Embed:
+    """
+    :param generic_name: generic name shared by the abilities
+    :param description: description of the generic ability
+    :param abilities: abilities with the generic name
+    :return: embed listing the names of the abilities
+    """
+    names = natsort.natsorted(set(ab.name for ab in abilities), reverse=True)
+    if len(names) > 15:
+        names = names[:15] + ["..."]
 
-                add_query(gen_name, embed)
+    name_list = "\n".join(names)
+    return discord.Embed(
+        title=f"{generic_name} (Disambiguation)",
+        description=f"{description}\n\n{name_list}".strip(),
+        color=0xFF7000
+    )
 
 
 def create_showcase_queries(add_query: typing.Callable):
@@ -1,5 +1,6 @@
 import data
 import hook
+import util
 import config
 import fuzzy_match
 import logging
@@ -24,16 +25,29 @@ class SimShowcaseCache:
     default_showcase = None
 
     @classmethod
-    def update_data(cls):
+    async def update_data(cls):
+        """
+        Creates the summonable showcases and their matcher from the current data in the background, then replaces the
+        current ones with them.
+        """
+        cls.default_showcase, cls.showcases, cls.showcase_matcher = await util.run_in_background(
+            cls.create_data, "Built summon showcases"
+        )
+
+    @classmethod
+    def create_data(cls):
+        """
+        Creates the summonable showcases and their matcher from the current data.
+        :return: tuple of (default showcase, dict of showcases by key, showcase matcher)
+        """
         default_showcase = data.Showcase()
         default_showcase.name = "none"
-        cls.default_showcase = NormalSS(default_showcase)
 
         new_cache = {}
         showcase_blacklist = config.get_global("general")["summonable_showcase_blacklist"]
-        for sc in data.Showcase.get_all():
+        for sc in data.Showcase.repository.where(type="Regular"):
             if sc.name not in showcase_blacklist:
-                if sc.type == "Regular" and not sc.name.startswith("Dragon Special"):
+                if not sc.name.startswith("Dragon Special"):
                     new_cache[sc.get_key()] = SimShowcaseFactory.create_showcase(sc)
 
         matcher_additions = new_cache.copy()
@@ -56,8 +70,7 @@ class SimShowcaseCache:
                 if old in sc_name:
                     matcher.add(sc_name.replace(old, new), sim_sc)
 
-        cls.showcases = new_cache
-        cls.showcase_matcher = matcher
+        return NormalSS(default_showcase), new_cache, matcher
 
     @classmethod
     def get(cls, name: str):
@@ -120,10 +133,12 @@ class SimShowcase(abc.ABC):
             if e.rarity:
                 self.entity_pools[e.rarity][True][type(e)].append(e)
 
-        normal_pool = (set(data.Adventurer.get_all()) | set(data.Dragon.get_all())) - set(featured_pool)
-        for e in normal_pool:
-            if e.rarity and self.is_entity_in_normal_pool(e):
-                self.entity_pools[e.rarity][False][type(e)].append(e)
+        featured_set = set(featured_pool)
+        for rarity, rarity_pools in self.entity_pools.items():
+            for entity_type, normal_pool in rarity_pools[False].items():
+                for e in entity_type.repository.where(rarity=rarity):
+                    if e not in featured_set and self.is_entity_in_normal_pool(e):
+                        normal_pool.append(e)
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -1,37 +1,103 @@
+import time
+import asyncio
 import aiohttp
 import logging
+import config
 import hook
 
 from data import abc
+from . import _snapshot
+from ._snapshot import get_data_hash
 from ._static import Element, WeaponType, Resistance, DragonGift, get_rarity_colour
 from ._entities import Adventurer, Dragon, Wyrmprint, Weapon, Skill, Ability, CoAbility, ChainCoAbility, Showcase
 
 logger = logging.getLogger(__name__)
 
+# entity types whose repositories must be mapped before each repository can be mapped, as entities are looked up from
+# them during mapping. Repositories are mapped in the order listed here, so each comes after its dependencies.
+repository_dependencies = {
+    Skill: (),
+    Ability: (),
+    CoAbility: (),
+    ChainCoAbility: (),
+    Adventurer: (Skill, Ability, CoAbility, ChainCoAbility),
+    Dragon: (Skill, Ability),
+    Wyrmprint: (Ability,),
+    Weapon: (Skill, Ability),
+    Showcase: (Adventurer, Dragon),
+}
+
+# held while the repositories are replaced and the data_downloaded hook runs, as the hook builds matchers and other data
+# from the repositories in the background, and updates modify some entities in place
+update_lock = asyncio.Lock()
+
 
 async def update_repositories():
-    async with aiohttp.ClientSession() as session:
-        logger.info("Updating skill repository")
-        await Skill.repository.update_data(session)
-        logger.info("Updating ability repository")
-        await Ability.repository.update_data(session)
-        logger.info("Updating coability repository")
-        await CoAbility.repository.update_data(session)
-        logger.info("Updating chain coability repository")
-        await ChainCoAbility.repository.update_data(session)
-        logger.info("Updating adventurer repository")
-        await Adventurer.repository.update_data(session)
-        logger.info("Updating dragon repository")
-        await Dragon.repository.update_data(session)
-        logger.info("Updating wyrmprint repository")
-        await Wyrmprint.repository.update_data(session)
-        logger.info("Updating weapon repository")
-        await Weapon.repository.update_data(session)
-        logger.info("Updating summon showcase repository")
-        await Showcase.repository.update_data(session)
-        logger.info("Updated all repositories.")
-
-    await hook.Hook.get("data_downloaded")()
+    """
+    Downloads and maps the data of every repository, saves the snapshot and calls the data_downloaded hook. Updates
+    run one at a time, and each waits for the work of the data_downloaded hook of the one before it to finish.
+    """
+    async with update_lock:
+        start_time = time.perf_counter()
+        fetch_times = {}
+        map_times = {}
+
+        async def fetch_repository(entity_type):
+            repository = entity_type.repository
+            fetch_start_time = time.perf_counter()
+            query_data = await repository.process_query(session)
+            fetch_times[repository.table_name] = time.perf_counter() - fetch_start_time
+            logger.info(f"Fetched {len(query_data)} rows from {repository.table_name} "
+                        f"in {fetch_times[repository.table_name]:.2f} seconds")
+            return query_data
+
+        def map_repository(entity_type, query_data: list):
+            repository = entity_type.repository
+            map_start_time = time.perf_counter()
+            repository.map_data(query_data, [d.repository for d in repository_dependencies[entity_type]])
+            map_times[repository.table_name] = time.perf_counter() - map_start_time
+            logger.info(f"Updated {repository.table_name} repository in {map_times[repository.table_name]:.2f} seconds")
+
+        max_connections = config.get_global("general")["data_update_connections"]
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_connections)) as session:
+            results = await asyncio.gather(*(fetch_repository(e) for e in repository_dependencies),
+                                           return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+        # post processors reset values on kept entities which their dependents' mapping sets again, so nothing is mapped
+        # until every table has been fetched, and then every repository is mapped without serving queries in between
+        try:
+            for entity_type, query_data in zip(repository_dependencies, results):
+                map_repository(entity_type, query_data)
+        finally:
+            abc.EntityMapper.value_pool.clear()
+
+        logger.info(f"Updated all repositories in {time.perf_counter() - start_time:.2f} seconds "
+                    f"({sum(fetch_times.values()):.2f} seconds fetching, "
+                    f"{sum(map_times.values()):.2f} seconds mapping)")
+
+        # noinspection PyBroadException
+        try:
+            await _snapshot.save_snapshot()
+        except Exception:
+            logger.exception("Could not save data snapshot:")
+
+        await hook.Hook.get("data_downloaded")()
+
+
+async def load_repositories_from_snapshot():
+    """
+    Populates all repositories from the on-disk data snapshot, if a usable snapshot exists.
+    :return: True if the repositories were populated, False otherwise
+    """
+    async with update_lock:
+        if not _snapshot.load_snapshot():
+            return False
+
+        await hook.Hook.get("data_downloaded")()
+        return True
 
 
 hook.Hook.get("download_data").attach(update_repositories)
@@ -5,7 +5,7 @@ import re
 import util
 import datetime
 import logging
-from typing import List, Optional
+from typing import List, Tuple, Optional, NamedTuple
 from data import abc
 from ._static import Element, WeaponType, DragonGift, get_rarity_colour
 
@@ -17,6 +17,11 @@ class Adventurer(abc.Entity):
     Represents an adventurer and some of their associated data
     """
 
+    __slots__ = (
+        "full_name", "name", "title", "description", "obtained", "availability", "release_date", "weapon_type",
+        "rarity", "element", "max_hp", "max_str", "max_might", "max_nodes", "icon_name", "skill_1", "skill_2",
+        "ability_1", "ability_2", "ability_3", "coability", "chain_coability", "is_playable"
+    )
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -26,7 +31,7 @@ class Adventurer(abc.Entity):
     @classmethod
     def init(cls):
         mapper = abc.EntityMapper(Adventurer)
-        cls.repository = abc.EntityRepository(mapper, "Adventurers")
+        cls.repository = abc.EntityRepository(mapper, "Adventurers", indexes=("rarity",))
 
         mp = mapper.add_property  # mapper property
         mf = abc.EntityMapper  # mapper functions
@@ -62,7 +67,7 @@ class Adventurer(abc.Entity):
 
         mapper.set_post_process_args("EditSkillId", "EditSkillCost")
 
-        def post_processor(adv: Adventurer):
+        def post_processor(adv: Adventurer, pp: dict):
             try:
                 adv.max_might = sum((
                     adv.max_hp,
@@ -79,8 +84,6 @@ class Adventurer(abc.Entity):
             except (IndexError, TypeError, AttributeError):
                 adv.max_might = None
 
-            pp = getattr(adv, "_POST_PROCESS")
-            delattr(adv, "_POST_PROCESS")
             shared_skill_id = pp["EditSkillId"]
             for sk in [adv.skill_1, adv.skill_2]:
                 if sk:
@@ -156,6 +159,11 @@ class Dragon(abc.Entity):
     Represents a dragon and some of their associated data
     """
 
+    __slots__ = (
+        "full_name", "name", "title", "description", "obtained", "availability", "release_date", "rarity", "element",
+        "max_hp", "max_str", "max_might", "favourite_gift", "icon_name", "skill", "ability_1", "ability_2",
+        "is_playable"
+    )
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -165,7 +173,7 @@ class Dragon(abc.Entity):
     @classmethod
     def init(cls):
         mapper = abc.EntityMapper(Dragon)
-        cls.repository = abc.EntityRepository(mapper, "Dragons")
+        cls.repository = abc.EntityRepository(mapper, "Dragons", indexes=("rarity", "favourite_gift"))
 
         mp = mapper.add_property  # mapper property
         mf = abc.EntityMapper  # mapper functions
@@ -188,7 +196,7 @@ class Dragon(abc.Entity):
         mp("ability_2", mf.filtered_list_of(Ability.find), *(f"Abilities2{i + 1}" for i in range(5)))
         mp("skill", Skill.find, "SkillID")
 
-        def post_processor(dragon: Dragon):
+        def post_processor(dragon: Dragon, pp: dict):
             try:
                 # max might adds 300 for bond 30, 100 for skill 1
                 dragon.max_might = sum((
@@ -277,6 +285,10 @@ class Wyrmprint(abc.Entity):
     Represents a wyrmprint and some of its associated data
     """
 
+    __slots__ = (
+        "name", "rarity", "obtained", "availability", "release_date", "max_hp", "max_str", "max_might", "icon_name",
+        "ability_1", "ability_2", "ability_3"
+    )
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -295,7 +307,7 @@ class Wyrmprint(abc.Entity):
         mp("rarity", mf.int, "Rarity")
         mp("max_hp", mf.int, "MaxHp")
         mp("max_str", mf.int, "MaxAtk")
-        mp("obtained", lambda s: re.split("[,\n]+", mf.text(s)) if mf.text(s) else None, "Obtain")
+        mp("obtained", lambda s: tuple(re.split("[,\n]+", mf.text(s))) if mf.text(s) else None, "Obtain")
         mp("availability", mf.text, "Availability")
         mp("release_date", mf.date, "ReleaseDate")
         mp("icon_name", lambda i: f"{i}_02", "BaseId")
@@ -303,7 +315,7 @@ class Wyrmprint(abc.Entity):
         mp("ability_2", mf.filtered_list_of(Ability.find), *(f"Abilities2{i + 1}" for i in range(3)))
         mp("ability_3", mf.filtered_list_of(Ability.find), *(f"Abilities3{i + 1}" for i in range(3)))
 
-        def post_processor(wp: Wyrmprint):
+        def post_processor(wp: Wyrmprint, pp: dict):
             try:
                 wp.max_might = sum((
                     wp.max_hp,
@@ -322,7 +334,7 @@ class Wyrmprint(abc.Entity):
     def __init__(self):
         self.name = ""
         self.rarity = 0
-        self.obtained = []
+        self.obtained: Tuple[str, ...] = ()
         self.availability = ""
         self.release_date: Optional[datetime.datetime] = None
         self.max_hp = 0
@@ -368,6 +380,10 @@ class Weapon(abc.Entity):
     """
     Represents a weapon and some of its associated data
     """
+    __slots__ = (
+        "name", "rarity", "element", "weapon_type", "obtained", "availability", "max_hp", "max_str", "max_might",
+        "icon_name", "skill", "ability_1", "ability_2", "crafting_materials", "crafted_from", "crafted_to", "tier"
+    )
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -377,7 +393,7 @@ class Weapon(abc.Entity):
     @classmethod
     def init(cls):
         mapper = abc.EntityMapper(Weapon)
-        cls.repository = abc.EntityRepository(mapper, "Weapons")
+        cls.repository = abc.EntityRepository(mapper, "Weapons", page_concurrency=4)
 
         mp = mapper.add_property  # mapper property
         mf = abc.EntityMapper  # mapper functions
@@ -397,7 +413,7 @@ class Weapon(abc.Entity):
 
         mapper.set_post_process_args("CraftGroupId", "CraftNodeId", "ParentCraftNodeId")
 
-        def mapper_post_processor(weapon: Weapon):
+        def mapper_post_processor(weapon: Weapon, pp: dict):
             # max might adds 100 for skill if it exists
             try:
                 weapon.max_might = sum((
@@ -415,15 +431,18 @@ class Weapon(abc.Entity):
 
             return True
 
-        def repo_post_processor(weapons: dict):
+        def repo_post_processor(weapons: dict, post_process_data: dict):
             craft_groups = collections.defaultdict(lambda: collections.defaultdict(list))
             craft_index = {}
 
             w: Weapon
             for w in weapons.values():
+                # weapons kept from the previous update may have links to weapons which have since been replaced
+                w.crafted_from = None
+                w.crafted_to = []
+
                 # add to craft groups map for second pass
-                pp = getattr(w, "_POST_PROCESS")
-                delattr(w, "_POST_PROCESS")
+                pp = post_process_data[w]
                 group_id = mf.text(pp["CraftGroupId"])
                 if group_id:
                     node_id = mf.text(pp["CraftNodeId"])
@@ -515,16 +534,13 @@ class Skill(abc.Entity):
     """
     Represents a skill and some of its associated data
     """
+    __slots__ = ("id", "name", "sp_regen", "levels", "owner", "share_cost", "icon_name")
     repository: abc.EntityRepository = None
 
-    class SkillLevel:
-        def __init__(self, desc: str, sp: int, share_sp: int):
-            self.description = desc
-            self.sp = sp
-            self.share_sp = share_sp
-
-        def __repr__(self):
-            return str(vars(self))
+    class SkillLevel(NamedTuple):
+        description: str
+        sp: int
+        share_sp: int
 
     @classmethod
     def get_all(cls):
@@ -552,7 +568,7 @@ class Skill(abc.Entity):
             arg_groups = itertools.zip_longest(*([iter(args[1:])] * 3))
             mapped_levels = itertools.starmap(map_level, arg_groups)
             valid_levels = list(itertools.takewhile(lambda sl: sl.description, mapped_levels))
-            return valid_levels[:max_level]
+            return tuple(valid_levels[:max_level])
 
         mp("id", mf.first_of(mf.list), "SkillId")
         mp("name", mf.text, "Name")
@@ -566,11 +582,19 @@ class Skill(abc.Entity):
 
         mapper.set_secondary_keys("SkillId", ignore_first=True)
 
+        def repo_post_processor(skills: dict, post_process_data: dict):
+            # owners and share costs are assigned again by the post-processors of Adventurer, Dragon, and Weapon
+            for sk in skills.values():
+                sk.owner = []
+                sk.share_cost = 0
+
+        cls.repository.post_processor = repo_post_processor
+
     def __init__(self):
         self.id = ""
         self.name = ""
         self.sp_regen = 0
-        self.levels: List[Skill.SkillLevel] = []
+        self.levels: Tuple[Skill.SkillLevel, ...] = ()
         self.owner: List[abc.Entity] = []  # updated in postprocess of Adventurer, Dragon, Weapon
         self.share_cost = 0  # assigned in postprocess of Adventurer
         self.icon_name = ""
@@ -604,6 +628,7 @@ class Ability(abc.Entity):
     """
     Represents an ability and some of its associated data
     """
+    __slots__ = ("id", "name", "generic_name", "description", "might", "icon_name")
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -620,7 +645,7 @@ class Ability(abc.Entity):
             return re.sub(r"\([^)]+\)", "", text).replace("%", "").strip() or None
 
         mapper = abc.EntityMapper(Ability)
-        cls.repository = abc.EntityRepository(mapper, "Abilities")
+        cls.repository = abc.EntityRepository(mapper, "Abilities", page_concurrency=4)
 
         mp = mapper.add_property  # mapper property
         mf = abc.EntityMapper  # mapper functions
@@ -670,6 +695,7 @@ class CoAbility(abc.Entity):
     """
     Represents a co-ability and some of its associated data
     """
+    __slots__ = ("id", "name", "generic_name", "description", "might", "icon_name")
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -729,6 +755,7 @@ class ChainCoAbility(abc.Entity):
     """
     Represents a chain co-ability and some of its associated data
     """
+    __slots__ = ("id", "name", "generic_name", "description", "icon_name")
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -787,6 +814,7 @@ class Showcase(abc.Entity):
     Represents a summon showcase and some of its associated data
     """
 
+    __slots__ = ("name", "page_name", "type", "start_date", "end_date", "featured_adventurers", "featured_dragons")
     repository: abc.EntityRepository = None
 
     @classmethod
@@ -802,7 +830,9 @@ class Showcase(abc.Entity):
             return list(filter(None, map(key_mapper, entity_name_list)))
 
         mapper = abc.EntityMapper(Showcase)
-        cls.repository = abc.EntityRepository(mapper, "SummonShowcase")
+        cls.repository = abc.EntityRepository(
+            mapper, "SummonShowcase", indexes=("type",), ordered_indexes=("end_date",)
+        )
 
         mp = mapper.add_property  # mapper property
         mf = abc.EntityMapper  # mapper functions
@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+import time
+import pickle
+import hashlib
+import logging
+import aiofiles
+import util
+from ._entities import Adventurer, Dragon, Wyrmprint, Weapon, Skill, Ability, CoAbility, ChainCoAbility, Showcase
+
+logger = logging.getLogger(__name__)
+
+# increment when entity classes or mapping functions change in a way that the table fields don't capture
+SNAPSHOT_VERSION = 5
+snapshot_file = util.path("data/snapshot.pickle.gz")
+
+snapshot_entity_types = (Skill, Ability, CoAbility, ChainCoAbility, Adventurer, Dragon, Wyrmprint, Weapon, Showcase)
+
+
+def get_fingerprint() -> str:
+    """
+    Creates a fingerprint of the mapped attributes and table fields of every repository, so that a snapshot created
+    with a different entity mapping is not loaded.
+    :return: fingerprint of the repository mappings
+    """
+    mappings = {
+        e.repository.table_name: {k: list(v) for k, v in e.repository.entity_mapper.inst_map_arg_keys.items()}
+        for e in snapshot_entity_types
+    }
+    return hashlib.sha1(json.dumps(mappings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_data_hash() -> str:
+    """
+    Creates a hash of the current data of all repositories, which changes whenever any of the rows the repositories
+    were mapped from change.
+    :return: hash of the repository data
+    """
+    data_hash = hashlib.sha1(f"{SNAPSHOT_VERSION}:{get_fingerprint()}".encode("utf-8"))
+    for e in snapshot_entity_types:
+        data_hash.update(e.repository.table_name.encode("utf-8"))
+        for row_hash in e.repository.mapped_rows:
+            data_hash.update(row_hash)
+    return data_hash.hexdigest()
+
+
+async def save_snapshot():
+    """
+    Writes the data of all repositories, along with the raw cargo rows they were mapped from, to the snapshot file.
+    All repositories are pickled together so that references between entities of different types are preserved. The
+    snapshot is serialised in the background, which is safe as long as the caller holds the update lock, so that the
+    entities aren't modified while they're pickled.
+    """
+    start_time = time.perf_counter()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": get_fingerprint(),
+        "created": time.time(),
+        "repositories": {
+            e.repository.table_name: {
+                "data": e.repository.data,
+                "raw_data": e.repository.raw_data,
+                "mapped_rows": e.repository.mapped_rows,
+                "dependency_keys": e.repository.dependency_keys
+            } for e in snapshot_entity_types
+        }
+    }
+    content = await util.run_in_background(
+        lambda: gzip.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), compresslevel=1),
+        "Serialised data snapshot"
+    )
+
+    os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+    temp_file = snapshot_file + ".tmp"
+    async with aiofiles.open(temp_file, "wb") as file:
+        await file.write(content)
+    os.replace(temp_file, snapshot_file)
+
+    logger.info(f"Saved data snapshot ({len(content) / 1024:.0f} kB) in {time.perf_counter() - start_time:.2f} seconds")
+
+
+def load_snapshot() -> bool:
+    """
+    Populates all repositories from the snapshot file, if it exists and matches the current entity mapping.
+    :return: True if the repositories were populated from the snapshot, False otherwise
+    """
+    start_time = time.perf_counter()
+    try:
+        with open(snapshot_file, "rb") as file:
+            snapshot = pickle.loads(gzip.decompress(file.read()))
+    except FileNotFoundError:
+        logger.info("No data snapshot found")
+        return False
+    except Exception:
+        logger.exception("Could not read data snapshot:")
+        return False
+
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("fingerprint") != get_fingerprint():
+        logger.info("Data snapshot is out of date, ignoring it")
+        return False
+
+    repositories = snapshot["repositories"]
+    if any(e.repository.table_name not in repositories for e in snapshot_entity_types):
+        logger.warning("Data snapshot is missing repositories, ignoring it")
+        return False
+
+    for e in snapshot_entity_types:
+        repository_snapshot = repositories[e.repository.table_name]
+        e.repository.data = repository_snapshot["data"]
+        e.repository.raw_data = repository_snapshot["raw_data"]
+        e.repository.mapped_rows = repository_snapshot["mapped_rows"]
+        e.repository.dependency_keys = repository_snapshot["dependency_keys"]
+        e.repository.build_indexes()
+
+    snapshot_age = (time.time() - snapshot["created"]) / 3600
+    logger.info(f"Loaded data snapshot from {snapshot_age:.1f} hours ago "
+                f"in {time.perf_counter() - start_time:.3f} seconds")
+    return True
@@ -1,6 +1,10 @@
+import os
+import sys
 import typing
+import asyncio
 import aiohttp
 import itertools
+import bisect
 import util
 import abc
 import datetime
@@ -9,6 +13,9 @@ import logging
 import html
 import mwparserfromhell
 import re
+import json
+import functools
+import hashlib
 import numbers
 import jinja2
 
@@ -16,6 +23,9 @@ logger = logging.getLogger(__name__)
 
 
 class Entity(abc.ABC):
+    # entities are kept in memory for the lifetime of the bot, so subclasses declare their attributes as slots
+    __slots__ = ()
+
     @classmethod
     @abc.abstractmethod
     def init(cls):
@@ -57,8 +67,14 @@ class Entity(abc.ABC):
         """
         return None
 
+    def is_current(self) -> bool:
+        """
+        :return: True if this entity is the one stored in its repository, False if it has been replaced or removed.
+        """
+        return type(self).repository.get_from_key(self.get_key()) is self
+
     def __repr__(self):
-        return str(vars(self))
+        return str({a: getattr(self, a) for c in type(self).__mro__ for a in getattr(c, "__slots__", ())})
 
     @abc.abstractmethod
     def __str__(self):
@@ -69,11 +85,15 @@ class EntityMapper:
     """
     Maps data from a dictionary to an Entity based on a set configuration.
     """
+    # immutable values shared between mapped entities, cleared once all repositories have been updated
+    value_pool = {}
+
     def __init__(self, target_class: typing.Type[Entity]):
         self.inst_class = target_class
         self.inst_map_funcs = {}
         self.inst_map_arg_keys = {}
         self.post_processor = None
+        self._compiled_map = None
 
     def add_property(self, attr_name: str, cast_function: typing.Callable, *args: str):
         """
@@ -90,15 +110,17 @@ class EntityMapper:
 
         self.inst_map_funcs[attr_name] = cast_function
         self.inst_map_arg_keys[attr_name] = args
+        self._compiled_map = None
 
     def set_post_process_args(self, *args: str):
         """
         Defines the data fields to be used for post-processing. Rather than assigning the values of these fields to
         their own attributes, the values are added to a dictionary (with key-value pairs of the field name and
-        value) stored in the _POST_PROCESS attribute.
+        value) which is passed to the post-processors along with the entity.
         :param args: names of the data fields to add to the post-process dictionary
         """
         self.inst_map_arg_keys["_POST_PROCESS"] = args
+        self._compiled_map = None
 
     def set_secondary_keys(self, keys_attr: str, ignore_first=True):
         """
@@ -109,63 +131,165 @@ class EntityMapper:
         """
         self.inst_map_arg_keys["_SECONDARY_KEYS"] = [keys_attr]
         self.inst_map_funcs["_SECONDARY_KEYS"] = lambda s: EntityMapper.list(s)[bool(ignore_first):]
+        self._compiled_map = None
 
-    def map(self, entity_data: dict):
-        inst = self.inst_class()
-        inst_keys = []
+    def compile(self):
+        """
+        Generates a mapping function specialised for the configured properties, so that mapping a row doesn't need to
+        look up the property configuration or check the entity attributes again. The function is regenerated
+        automatically after the configuration changes.
+        :return: function which takes a row of data and returns a tuple of (unprocessed entity, list of secondary keys,
+        post-process dictionary)
+        """
+        prototype = self.inst_class()
+        namespace = {
+            "inst_class": self.inst_class,
+            "log_exception": self._log_mapping_exception,
+            "invalid_key": self._raise_invalid_key,
+            "share": self.share,
+        }
+        lines = [
+            "def map_attributes(entity_data):",
+            "    get = entity_data.get",
+            "    inst = inst_class()",
+        ]
 
-        if "_POST_PROCESS" in self.inst_map_arg_keys:
-            setattr(inst, "_POST_PROCESS", {
-                prop_name: entity_data.get(prop_name)
-                for prop_name in self.inst_map_arg_keys["_POST_PROCESS"]
-            })
+        post_process_fields = self.inst_map_arg_keys.get("_POST_PROCESS", ())
+        lines.append("    post_process_args = {" + ", ".join(f"{f!r}: get({f!r})" for f in post_process_fields) + "}")
 
         if "_SECONDARY_KEYS" in self.inst_map_arg_keys:
-            arg_key = self.inst_map_arg_keys["_SECONDARY_KEYS"][0]
-            map_func = self.inst_map_funcs["_SECONDARY_KEYS"]
-            inst_keys = map_func(entity_data.get(arg_key))
+            namespace["secondary_keys"] = self.inst_map_funcs["_SECONDARY_KEYS"]
+            lines.append(f"    inst_keys = secondary_keys(get({self.inst_map_arg_keys['_SECONDARY_KEYS'][0]!r}))")
+        else:
+            lines.append("    inst_keys = []")
+
+        for index, (attr_name, map_func) in enumerate(self.inst_map_funcs.items()):
+            if attr_name in ("_POST_PROCESS", "_SECONDARY_KEYS"):
+                continue
+
+            if not attr_name.isidentifier() or not hasattr(prototype, attr_name):
+                raise AttributeError(f"Invalid entity attribute: {attr_name}")
+
+            arg_keys = self.inst_map_arg_keys[attr_name]
+            namespace[f"func_{index}"] = map_func
+            namespace[f"keys_{index}"] = arg_keys
+            args = "(" + "".join(f"get({k!r}), " for k in arg_keys) + ")"
+            lines += [
+                f"    args = {args}",
+                "    if None in args:",
+                f"        invalid_key(keys_{index}, args)",
+                "    try:",
+                f"        inst.{attr_name} = share(func_{index}(*args))",
+                "    except Exception:",
+                f"        log_exception({attr_name!r}, args)",
+                f"        inst.{attr_name} = None",
+            ]
+
+        lines.append("    return inst, inst_keys, post_process_args")
+        exec("\n".join(lines), namespace)
+        return namespace["map_attributes"]
 
-        for attr_name, map_func in self.inst_map_funcs.items():
-            if attr_name not in ("_POST_PROCESS", "_SECONDARY_KEYS"):
-                if not hasattr(inst, attr_name):
-                    raise AttributeError(f"Invalid entity attribute: {attr_name}")
+    @staticmethod
+    def share(value):
+        """
+        Returns a shared instance of an immutable value, so that values repeated across many entities (such as
+        availabilities, generic names and skill levels) are only stored once. Strings are interned, and tuples (along
+        with their items) and datetimes are taken from the value pool. Mapped attribute values are shared automatically.
+        :param value: value to share
+        :return: an equal value which may be shared, or the value itself if it can't be shared
+        """
+        if type(value) is str:
+            return sys.intern(value)
+        if isinstance(value, tuple):
+            shared_items = tuple(map(EntityMapper.share, value))
+            value = shared_items if type(value) is tuple else type(value)(*shared_items)
+        elif not isinstance(value, datetime.datetime):
+            return value
 
-                args = list(map(entity_data.get, self.inst_map_arg_keys[attr_name]))
-                if None in args:
-                    invalid_key = self.inst_map_arg_keys[attr_name][args.index(None)]
-                    raise KeyError(f"Invalid data key: {invalid_key}")
+        try:
+            return EntityMapper.value_pool.setdefault(value, value)
+        except TypeError:
+            return value
 
-                # noinspection PyBroadException
-                try:
-                    value = map_func(*args)
-                except Exception:
-                    logger.exception(f'Exception encountered while processing attribute "{attr_name}" with args {args}:')
-                    value = None
+    @staticmethod
+    def _raise_invalid_key(arg_keys: tuple, args: tuple):
+        raise KeyError(f"Invalid data key: {arg_keys[args.index(None)]}")
 
-                setattr(inst, attr_name, value)
+    @staticmethod
+    def _log_mapping_exception(attr_name: str, args: tuple):
+        logger.exception(f'Exception encountered while processing attribute "{attr_name}" with args {list(args)}:')
 
-        if not inst.get_key():
-            return None, []
+    def map_attributes(self, entity_data: dict):
+        """
+        Maps a row of data to a new entity without post-processing it.
+        :param entity_data: row of data to map
+        :return: tuple of (entity, list of secondary keys for the entity, post-process dictionary)
+        """
+        if self._compiled_map is None:
+            self._compiled_map = self.compile()
+        return self._compiled_map(entity_data)
 
-        if self.post_processor:
-            if not self.post_processor(inst):
-                return None, []
+    def map(self, entity_data: dict):
+        """
+        Maps a row of data to a new entity, and post-processes it.
+        :param entity_data: row of data to map
+        :return: tuple of (entity, list of keys for the entity, post-process dictionary). The entity is None and the
+        list of keys is empty if the row doesn't represent a valid entity.
+        """
+        inst, inst_keys, post_process_args = self.map_attributes(entity_data)
+
+        if not inst.get_key() or not self.post_process(inst, post_process_args):
+            return None, [], post_process_args
 
         inst_keys = [inst.get_key()] + inst_keys
-        return inst, inst_keys
+        return inst, inst_keys, post_process_args
+
+    def post_process(self, inst: Entity, post_process_args: dict):
+        """
+        Runs the post-processor on a mapped entity. Entities which are kept between repository updates are
+        post-processed again on each update, so post-processors must give the same result when run more than once.
+        :param inst: entity to post-process
+        :param post_process_args: post-process dictionary for the entity
+        :return: True if the entity is valid, False otherwise
+        """
+        return not self.post_processor or self.post_processor(inst, post_process_args)
+
+    def has_replaced_references(self, inst: Entity):
+        """
+        Checks whether any mapped attribute of an entity refers to an entity which has since been replaced or removed
+        from its repository, in which case the entity has to be mapped again.
+        :param inst: entity to check
+        :return: True if the entity refers to a replaced entity, False otherwise
+        """
+        for attr_name in self.inst_map_funcs:
+            if attr_name != "_SECONDARY_KEYS":
+                value = getattr(inst, attr_name)
+                for ref in (value if isinstance(value, list) else [value]):
+                    if isinstance(ref, Entity) and not ref.is_current():
+                        return True
+        return False
 
     # mapping helper methods
     @staticmethod
     def none(s: str):
         return s
 
+    # matches any html or wikicode which would be changed by strip_markup
+    markup_pattern = re.compile(r"[\[\]{}<>&']|://|\n\n\n|(?:^|\n)(?:[*#:;=]|----)")
+
     @staticmethod
+    @functools.lru_cache(maxsize=32768)
     def text(s: str):
+        if EntityMapper.markup_pattern.search(s):
+            s = EntityMapper.strip_markup(s)
+        spaces_reduced = re.sub(r" {2,}", " ", s)
+        return spaces_reduced.strip() or None
+
+    @staticmethod
+    def strip_markup(s: str):
         html_breaks_replaced = re.sub(r" *</? *br */?> *", "\n", html.unescape(s))
         tags_removed = re.sub(r"<[^<]+?>", "", html_breaks_replaced)
-        wikicode_removed = mwparserfromhell.parse(tags_removed).strip_code()
-        spaces_reduced = re.sub(r" {2,}", " ", wikicode_removed)
-        return spaces_reduced.strip() or None
+        return mwparserfromhell.parse(tags_removed).strip_code()
 
     @staticmethod
     def int(s: str):
@@ -211,15 +335,31 @@ class EntityRepository:
     """
     Stores and updates a particular type of entity using an EntityMapper
     """
-    def __init__(self, mapper: EntityMapper, table_name: str):
+    def __init__(self, mapper: EntityMapper, table_name: str, page_concurrency=1, indexes=(), ordered_indexes=()):
+        """
+        :param mapper: mapper used to create entities from the results of the cargo query
+        :param table_name: name of the cargo table to query
+        :param page_concurrency: number of result pages to request at the same time
+        :param indexes: names of attributes to index, to find entities by attribute value using where
+        :param ordered_indexes: names of attributes to index in order, to find entities by a range of attribute values
+        using where_between
+        """
         self.table_name = table_name
         self.entity_mapper = mapper
+        self.page_concurrency = page_concurrency
         self.data = {}
+        self.raw_data = []
+        self.mapped_rows = {}
+        # hashes of the keys of the repositories this repository's entities were mapped with, by table name
+        self.dependency_keys = {}
         self.post_processor = None
+        self.entities = []
+        self.indexes = {attr_name: {} for attr_name in indexes}
+        self.ordered_indexes = {attr_name: ([], []) for attr_name in ordered_indexes}
 
     def get_query_url(self, limit: int, offset: int):
         base_url = "https://dragalialost.gamepedia.com/api.php?"
-        table_fields = ",".join(set(itertools.chain(*self.entity_mapper.inst_map_arg_keys.values())))
+        table_fields = ",".join(sorted(set(itertools.chain(*self.entity_mapper.inst_map_arg_keys.values()))))
         params = {
             "action": "cargoquery",
             "format": "json",
@@ -232,10 +372,35 @@ class EntityRepository:
 
         return base_url + "&".join(k+"="+v for k, v in params.items())
 
+    async def process_page(self, session: aiohttp.ClientSession, limit: int, offset: int, retries=3, retry_delay=1.0):
+        """
+        Retrieves a single page of results for this repository's json cargo query. Failed requests are retried, with
+        the delay doubling after each attempt.
+        :param session: aiohttp.ClientSession to use for the request
+        :param limit: result limit for the request
+        :param offset: offset of the first result in the page
+        :param retries: number of times to retry a failed request
+        :param retry_delay: delay in seconds before the first retry
+        :return: list of result entries in the page
+        """
+        query_url = self.get_query_url(limit, offset)
+        for attempt in range(retries + 1):
+            logger.info(f"Querying url {query_url}")
+            try:
+                async with session.get(query_url) as response:
+                    result_json = await response.json()
+                return [d["title"] for d in result_json["cargoquery"]]
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError):
+                if attempt == retries:
+                    raise
+                delay = retry_delay * 2 ** attempt
+                logger.warning(f"Query for {self.table_name} at offset {offset} failed, retrying in {delay:.0f} seconds")
+                await asyncio.sleep(delay)
+
     async def process_query(self, session: aiohttp.ClientSession, limit=500):
         """
         Retrieves the results for this parser's json cargo query, which may be split across multiple queries due to a
-        result limit.
+        result limit. Pages are requested page_concurrency at a time, as the number of results isn't known in advance.
         :param session: aiohttp.ClientSession to use for the requests
         :param limit: result limit for each request
         :return: list of result entries
@@ -244,23 +409,46 @@ class EntityRepository:
         offset = 0
         result_items = []
         while True:
-            query_url = self.get_query_url(limit, offset)
-            logger.info(f"Querying url {query_url}")
-            async with session.get(query_url) as response:
-                result_json = await response.json()
-                inner_result_list = result_json["cargoquery"]
-                query_items = [d["title"] for d in inner_result_list]
+            page_offsets = range(offset, offset + limit * self.page_concurrency, limit)
+            pages = await asyncio.gather(*(self.process_page(session, limit, o) for o in page_offsets))
+            for query_items in pages:
                 result_items += query_items
-                offset += limit
-                if len(query_items) < limit or len(inner_result_list) == 0:
+                if len(query_items) < limit:
                     return result_items
+            offset += limit * self.page_concurrency
 
-    async def update_data(self, session: aiohttp.ClientSession):
+    async def update_data(self, session: aiohttp.ClientSession, dependencies=()):
         query_data = await self.process_query(session)
+        self.map_data(query_data, dependencies)
+
+    def map_data(self, query_data: list, dependencies=()):
+        """
+        Maps the results of this repository's cargo query to entities, replacing the current data. Rows which haven't
+        changed since the last update keep their existing entity, unless it refers to an entity which has been replaced
+        in another repository. Every row is mapped again if any repository that entities are looked up from has gained
+        or lost keys, as a lookup which failed before may succeed now, or the other way round.
+        :param query_data: list of result entries, as returned by process_query
+        :param dependencies: repositories that entities are looked up from while mapping
+        """
+        dependency_keys = {d.table_name: d.get_keys_hash() for d in dependencies}
+        remap_all = dependency_keys != self.dependency_keys
 
+        mapped_rows_new = {}
         data_new = {}
+        post_process_data = {}
+        mapped_count = 0
         for e in query_data:
-            entity, entity_keys = self.entity_mapper.map(e)
+            row_hash = self.get_row_hash(e)
+            entity, entity_keys, post_process_args = self.mapped_rows.get(row_hash, (None, None, None))
+            if remap_all or entity_keys is None or (entity and self.entity_mapper.has_replaced_references(entity)):
+                entity, entity_keys, post_process_args = self.entity_mapper.map(e)
+                mapped_count += 1
+            elif entity and not self.entity_mapper.post_process(entity, post_process_args):
+                entity, entity_keys = None, []
+
+            mapped_rows_new[row_hash] = entity, entity_keys, post_process_args
+            if entity:
+                post_process_data[entity] = post_process_args
             for key in entity_keys:
                 if key in data_new:
                     logger.warning(f"Key {key} duplicated in table {self.table_name}")
@@ -268,23 +456,88 @@ class EntityRepository:
                     data_new[key] = entity
 
         if self.post_processor:
-            self.post_processor(data_new)
+            self.post_processor(data_new, post_process_data)
 
         self.data = data_new
+        self.raw_data = query_data
+        self.mapped_rows = mapped_rows_new
+        self.dependency_keys = dependency_keys
+        self.build_indexes()
+        logger.info(f"Mapped {mapped_count} new or changed rows of {len(query_data)} in table {self.table_name}")
+
+    def build_indexes(self):
+        """
+        Rebuilds the list of distinct entities and the attribute indexes from the current data. Must be called whenever
+        the data is replaced.
+        """
+        self.entities = list({id(e): e for e in self.data.values()}.values())
+
+        for attr_name in self.indexes:
+            index = {}
+            for e in self.entities:
+                index.setdefault(getattr(e, attr_name), []).append(e)
+            self.indexes[attr_name] = index
+
+        for attr_name in self.ordered_indexes:
+            ordered_entities = sorted(
+                (e for e in self.entities if getattr(e, attr_name) is not None),
+                key=lambda e: getattr(e, attr_name)
+            )
+            self.ordered_indexes[attr_name] = [getattr(e, attr_name) for e in ordered_entities], ordered_entities
+
+    def where(self, **conditions) -> list:
+        """
+        Finds the entities whose attributes have the given values, using the attribute indexes where they exist.
+        :param conditions: attribute names and the values they must have
+        :return: list of matching entities, in the order they were retrieved
+        """
+        indexed_matches = [self.indexes[a].get(v, []) for a, v in conditions.items() if a in self.indexes]
+        candidates = min(indexed_matches, key=len) if indexed_matches else self.entities
+        return [e for e in candidates if all(getattr(e, a) == v for a, v in conditions.items())]
+
+    def where_between(self, attr_name: str, lower, upper) -> list:
+        """
+        Finds the entities whose value of an attribute with an ordered index is within a range.
+        :param attr_name: name of the attribute, which must be in ordered_indexes
+        :param lower: lower bound of the range (inclusive)
+        :param upper: upper bound of the range (exclusive)
+        :return: list of matching entities, in the order of the attribute value
+        """
+        values, ordered_entities = self.ordered_indexes[attr_name]
+        return ordered_entities[bisect.bisect_left(values, lower):bisect.bisect_left(values, upper)]
+
+    @staticmethod
+    def get_row_hash(row: dict):
+        """
+        :param row: result entry from a cargo query
+        :return: hash of the content of the result entry
+        """
+        return hashlib.blake2b(json.dumps(row, sort_keys=True).encode("utf-8"), digest_size=16).digest()
+
+    def get_keys_hash(self) -> bytes:
+        """
+        :return: hash of the keys of the current data, which changes whenever an entity is added or removed
+        """
+        return hashlib.blake2b("\n".join(sorted(map(str, self.data))).encode("utf-8"), digest_size=16).digest()
 
     def get_from_key(self, key):
         return self.data.get(key)
 
 
 class EmbedContentGenerator:
+    bytecode_cache_directory = util.path("data/template_cache")
     env = jinja2.Environment(
         autoescape=False,
         loader=jinja2.FileSystemLoader(util.path("templates")),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_cache_directory),
         lstrip_blocks=True,
         undefined=jinja2.ChainableUndefined,
         finalize=lambda v: EmbedContentGenerator._finalise(v),
         auto_reload=False
     )
+    # maps each template name, without the extension, to the template, once load_templates has been called at startup;
+    # templates that haven't been loaded are looked up when they're rendered
+    templates = {}
 
     @staticmethod
     def _finalise(v):
@@ -313,7 +566,23 @@ class EmbedContentGenerator:
     env.filters["element_emote"] = lambda value: util.get_emote(value or "none")
     env.filters["tier_emote"] = lambda value: util.get_emote(f"wtier{value or 0}")
 
+    @classmethod
+    def load_templates(cls):
+        """
+        Compiles every template, or loads it from the bytecode cache if its source hasn't changed since it was cached,
+        so that rendering doesn't have to look templates up or compile them on first use.
+        """
+        os.makedirs(cls.bytecode_cache_directory, exist_ok=True)
+        cls.templates = {
+            os.path.splitext(name)[0]: cls.env.get_template(name) for name in cls.env.list_templates(extensions=["j2"])
+        }
+
     @classmethod
     def get_embed_content(cls, template_name: str, **kwargs):
-        rendered = cls.env.get_template(f"{template_name}.j2").render(**kwargs)
+        template = cls.templates.get(template_name)
+        if template is None:
+            # the template is compiled and saved to the bytecode cache, which doesn't create its directory
+            os.makedirs(cls.bytecode_cache_directory, exist_ok=True)
+            template = cls.env.get_template(f"{template_name}.j2")
+        rendered = template.render(**kwargs)
         return tuple(rendered.split("\n", maxsplit=1))
@@ -1,26 +1,373 @@
+import os
+import re
+import bisect
+import pickle
+import typing
+import itertools
+import collections
 import jellyfish
 import pybktree
 import logging
 
 logger = logging.getLogger(__name__)
 
+# int.bit_count is only available from Python 3.10
+count_bits = getattr(int, "bit_count", lambda n: bin(n).count("1"))
+
+
+class BKTreeIndex:
+    """
+    Index of match keys stored in a BK-tree, searched by computing the edit distance to the keys at each visited node.
+    """
+    def __init__(self):
+        self.tree = pybktree.BKTree(jellyfish.damerau_levenshtein_distance)
+
+    def add(self, key: str):
+        self.tree.add(key)
+
+    def find(self, query: str, max_distance: float):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :return: all keys within the maximum distance, as a list of tuples (edit distance, key) sorted by distance
+        """
+        return self.tree.find(query, max_distance)
+
+    def find_closest(self, query: str, max_distance: float, targets: typing.Container = None):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of the key to find
+        :param targets: keys to restrict the search to, or None to search all keys
+        :return: the first tuple of (edit distance, key) that find would return, or None if there is no key within the
+        maximum distance
+        """
+        results = self.find(query, max_distance)
+        return next((r for r in results if targets is None or r[1] in targets), None)
+
+    def find_nearest(self, query: str, max_distance: float, count: int):
+        """
+        Once count keys have been found, the search only visits nodes which could contain a closer key.
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :param count: maximum number of keys to find
+        :return: the first count tuples of (edit distance, key) that find would return
+        """
+        nearest = []
+        if self.tree.tree is None or count <= 0:
+            return nearest
+
+        # keys are visited in the same order as find, which the visit number records to resolve ties in the same way
+        distance_func = self.tree.distance_func
+        candidates = collections.deque([self.tree.tree])
+        visit_number = 0
+        while candidates:
+            key, children = candidates.popleft()
+            distance = distance_func(key, query)
+            if distance <= max_distance:
+                bisect.insort(nearest, (distance, visit_number, key))
+                if len(nearest) > count:
+                    nearest.pop()
+                if len(nearest) == count:
+                    max_distance = nearest[-1][0] - 1
+            visit_number += 1
+            candidates.extend(child for d, child in children.items() if abs(distance - d) <= max_distance)
+
+        return [(distance, key) for distance, _, key in nearest]
+
+
+class LengthBucketIndex:
+    """
+    Index of match keys grouped by length. Since the edit distance between two strings is at least the difference in
+    their lengths, only keys of similar length to the query are compared, starting with those of the same length, and
+    the search stops once the length difference exceeds the distance of the closest key found so far. Keys are also
+    skipped without computing the edit distance if the characters they contain differ too much from the query.
+    Keys at the same distance from a query are ordered by when they were added.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.key_count = 0
+
+    @staticmethod
+    def get_character_mask(s: str):
+        """
+        :param s: string to get the mask of
+        :return: bit mask with a bit for each character contained in the string, and a second bit for each character
+        contained more than once (non-ASCII characters may share bits)
+        """
+        mask = 0
+        for c in s:
+            bit = 1 << (ord(c) & 127)
+            if mask & bit:
+                bit <<= 128
+            mask |= bit
+        return mask
+
+    @staticmethod
+    def get_distance_lower_bound(mask_1: int, mask_2: int):
+        """
+        Each edit changes the number of times at most two characters appear in a string by one, which sets or clears at
+        most one of the bits of each character, so the number of bits set in only one of the masks of two strings is at
+        most twice their edit distance.
+        :param mask_1: character mask of the first string
+        :param mask_2: character mask of the second string
+        :return: lower bound of the edit distance between the two strings
+        """
+        return (count_bits(mask_1 ^ mask_2) + 1) // 2
+
+    def add(self, key: str):
+        self.buckets.setdefault(len(key), []).append((key, self.get_character_mask(key), self.key_count))
+        self.key_count += 1
+
+    def _get_candidates(self, query: str, max_distance: int):
+        # yields (length difference, keys with that length difference) in order of increasing length difference
+        for length_difference in range(max_distance + 1):
+            lengths = {len(query) - length_difference, len(query) + length_difference}
+            yield length_difference, [k for length in lengths for k in self.buckets.get(length, ())]
+
+    @staticmethod
+    def _score_candidates(query: str, query_mask: int, candidates: list, max_distance: int,
+                          targets: typing.Container = None):
+        # returns (edit distance, insertion order, key) of the candidates within the maximum distance. The candidates
+        # are filtered by the lower bound of their distance in one pass, then the distance function is mapped over the
+        # rest, rather than calling each in turn from a loop in Python.
+        if targets is not None:
+            candidates = [c for c in candidates if c[0] in targets]
+        max_bit_difference = 2 * max_distance
+        candidates = [c for c in candidates if count_bits(query_mask ^ c[1]) <= max_bit_difference]
+        distances = map(jellyfish.damerau_levenshtein_distance, itertools.repeat(query), [c[0] for c in candidates])
+        return [(distance, c[2], c[0]) for distance, c in zip(distances, candidates) if distance <= max_distance]
+
+    def find(self, query: str, max_distance: float):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :return: all keys within the maximum distance, as a list of tuples (edit distance, key) sorted by distance
+        """
+        max_distance = int(max_distance)
+        query_mask = self.get_character_mask(query)
+        results = []
+        for _, candidates in self._get_candidates(query, max_distance):
+            results.extend(self._score_candidates(query, query_mask, candidates, max_distance))
+        results.sort()
+        return [(distance, key) for distance, _, key in results]
+
+    def find_closest(self, query: str, max_distance: float, targets: typing.Container = None):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of the key to find
+        :param targets: keys to restrict the search to, or None to search all keys
+        :return: the first tuple of (edit distance, key) that find would return, or None if there is no key within the
+        maximum distance
+        """
+        max_distance = int(max_distance)
+        query_mask = self.get_character_mask(query)
+        closest = None
+        for length_difference, candidates in self._get_candidates(query, max_distance):
+            if length_difference > max_distance:
+                break
+
+            results = self._score_candidates(query, query_mask, candidates, max_distance, targets)
+            if results and (closest is None or min(results) < closest):
+                closest = min(results)
+                max_distance = closest[0]
+
+        return closest and (closest[0], closest[2])
+
+    def find_nearest(self, query: str, max_distance: float, count: int):
+        """
+        Once count keys have been found, the search stops when the length difference exceeds the distance of the
+        furthest of them.
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :param count: maximum number of keys to find
+        :return: the first count tuples of (edit distance, key) that find would return
+        """
+        max_distance = int(max_distance)
+        query_mask = self.get_character_mask(query)
+        nearest = []
+        for length_difference, candidates in self._get_candidates(query, max_distance):
+            if count <= 0 or length_difference > max_distance:
+                break
+
+            nearest = sorted(nearest + self._score_candidates(query, query_mask, candidates, max_distance))[:count]
+            if len(nearest) == count:
+                max_distance = nearest[-1][0]
+
+        return [(distance, key) for distance, _, key in nearest]
+
+
+class DeletionIndex:
+    """
+    Symmetric deletion index of match keys. Every string formed by deleting up to max_deletions characters from the
+    start of each key is stored, so that keys within that edit distance of a query are found by looking up the same
+    deletions of the query, rather than by comparing the query to other keys. Only the first prefix_length characters
+    are used, which bounds the number of deletions stored per key, at the cost of more candidates to check. Searches
+    for more distant keys fall back to a LengthBucketIndex, which needs to be scanned when nothing matches.
+    Keys at the same distance from a query are ordered by when they were added.
+    """
+    def __init__(self, max_deletions=2, prefix_length=7):
+        """
+        :param max_deletions: maximum edit distance of keys found using the deletion index
+        :param prefix_length: number of characters at the start of each key to take deletions of
+        """
+        self.max_deletions = max_deletions
+        self.prefix_length = prefix_length
+        self.deletions = {}
+        self.keys = []
+        self.fallback_index = LengthBucketIndex()
+
+    def _get_deletions(self, s: str, max_deletions: int):
+        # all strings formed by deleting up to max_deletions characters from the prefix of the string
+        deletions = {s[:self.prefix_length]}
+        edge = deletions
+        for _ in range(max_deletions):
+            edge = {d[:i] + d[i + 1:] for d in edge for i in range(len(d))}
+            deletions |= edge
+        return deletions
+
+    def add(self, key: str):
+        order = len(self.keys)
+        self.keys.append(key)
+        for deletion in self._get_deletions(key, self.max_deletions):
+            self.deletions.setdefault(deletion, []).append(order)
+        self.fallback_index.add(key)
+
+    def _find_nearby(self, query: str, max_distance: int, targets: typing.Container = None):
+        # returns (edit distance, insertion order, key) of all keys within a distance no greater than max_deletions
+        candidates = set()
+        for deletion in self._get_deletions(query, max_distance):
+            candidates.update(self.deletions.get(deletion, ()))
+
+        results = []
+        for order in candidates:
+            key = self.keys[order]
+            if abs(len(key) - len(query)) <= max_distance and (targets is None or key in targets):
+                distance = jellyfish.damerau_levenshtein_distance(query, key)
+                if distance <= max_distance:
+                    results.append((distance, order, key))
+        results.sort()
+        return results
+
+    def find(self, query: str, max_distance: float):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :return: all keys within the maximum distance, as a list of tuples (edit distance, key) sorted by distance
+        """
+        max_distance = int(max_distance)
+        if max_distance > self.max_deletions:
+            return self.fallback_index.find(query, max_distance)
+        return [(distance, key) for distance, _, key in self._find_nearby(query, max_distance)]
+
+    def find_closest(self, query: str, max_distance: float, targets: typing.Container = None):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of the key to find
+        :param targets: keys to restrict the search to, or None to search all keys
+        :return: the first tuple of (edit distance, key) that find would return, or None if there is no key within the
+        maximum distance
+        """
+        max_distance = int(max_distance)
+        results = self._find_nearby(query, min(max_distance, self.max_deletions), targets)
+        if results:
+            return results[0][0], results[0][2]
+        elif max_distance > self.max_deletions:
+            return self.fallback_index.find_closest(query, max_distance, targets)
+        return None
+
+    def find_nearest(self, query: str, max_distance: float, count: int):
+        """
+        :param query: string to search for
+        :param max_distance: maximum edit distance of keys to find
+        :param count: maximum number of keys to find
+        :return: the first count tuples of (edit distance, key) that find would return
+        """
+        max_distance = int(max_distance)
+        results = self._find_nearby(query, min(max_distance, self.max_deletions))
+        # every key within max_deletions has been found, so only a search for further keys needs the fallback index
+        if len(results) >= count or max_distance <= self.max_deletions:
+            return [(distance, key) for distance, _, key in results[:count]]
+        return self.fallback_index.find_nearest(query, max_distance, count)
+
 
 class Matcher:
-    def __init__(self, match_threshold=lambda s: 1 + 0.3 * len(s)):
-        self.match_tree = pybktree.BKTree(jellyfish.damerau_levenshtein_distance)
+    """
+    Matches input strings to the closest target string. Lookups try each of these layers in turn, stopping at the first
+    one which finds a match, unless a later layer can find a closer one:
+    - exact: the input string is a target string
+    - normalised: the input string is a target string when both ignore case, articles, whitespace and punctuation (the
+      shortest such target string is used)
+    - prefix: the input string is the start of a target string, and the rest of the target string is within the match
+      threshold (the shortest such target string is used)
+    - fuzzy: the target string with the smallest edit distance within the match threshold, which is also searched for
+      when the normalised or prefix match is more than one edit away, and used if it's closer
+    Targets can also be added as a suffix (such as "s1") of another target, which is only stored against that target
+    rather than as a separate key of the index. Lookups split up to as many words as the longest suffix off the end of
+    the input string, also trying each split with its space moved by one character, and match the rest against the
+    targets which have a matching suffix, using the same layers for both parts. When no split matches within one edit,
+    the input string is also split at every position near its end, matching the suffix and the rest by edit distance.
+    The sum of the edit distances of the parts, and the latest layer used by either part, are compared with the match
+    of the whole input string, and the match with the smallest distance, then the earliest layer, is used.
+    The results of recent lookups are kept in a least recently used cache, which is cleared when targets are added. A
+    rebuilt matcher starts with an empty cache, so results are never shared between versions of the data.
+    """
+    engines = {
+        "bktree": BKTreeIndex,
+        "length_buckets": LengthBucketIndex,
+        "deletions": DeletionIndex,
+    }
+    layers = ("exact", "normalised", "prefix", "fuzzy")
+
+    # increment when the saved attributes or the layout of the indexes change
+    FILE_VERSION = 4
+    saved_attributes = ("match_index", "match_map", "normalised_map", "prefix_map", "suffix_map", "max_suffix_words",
+                        "max_query_len")
+
+    # articles are only removed before a word which starts with a letter, so that the "a" of a split suffix like "a 1",
+    # or of a suffix that's still being typed at the end of the input string, is kept
+    normalise_pattern = re.compile(r"\b(?:the|an?)\b(?=[\W_]+[^\W\d_])|[\W_]+")
+
+    def __init__(self, match_threshold=lambda s: 1 + 0.3 * len(s), engine="length_buckets", cache_size=0):
+        """
+        :param match_threshold: function returning the maximum edit distance of a match for an input string
+        :param engine: name of the index type used to search for matches, one of the keys of Matcher.engines
+        :param cache_size: maximum number of lookup results to cache, 0 to disable caching
+        """
+        self.match_index = self.engines[engine]()
         self.match_map = {}
+        self.normalised_map = {}
+        self.prefix_map = {}
+        self.suffix_map = {}
+        self.max_suffix_words = 0
         self.max_query_len = 0
         self.get_match_threshold = match_threshold
+        self.layer_hits = dict.fromkeys(self.layers + ("none",), 0)
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
 
-    def add(self, target: str, result, suppress_warning=False):
+    @classmethod
+    def normalise(cls, s: str):
+        """
+        :param s: string to normalise
+        :return: the string in lower case, without articles, whitespace or punctuation
+        """
+        return cls.normalise_pattern.sub("", s.lower())
+
+    def add(self, target: str, result, suppress_warning=False, suffix: str = None):
         """
         Adds a string as a match target, with a result object to map to it.
         :param target: target string to map to result object
         :param result: object to map, may not be None
         :param suppress_warning: suppress the generation of a warning in the case that the target string already exists
+        :param suffix: words which follow the target string to match the result, in which case the target string must
+        already have been added without a suffix
         """
         target_str = target.lower()
-        if target_str in self.match_map:
+        if suffix is not None:
+            self._add_suffixed(target_str, suffix.lower(), result, suppress_warning)
+            return
+        elif target_str in self.match_map:
             if not suppress_warning:
                 logger.warning(f'Match string "{target_str}" already exists, ignoring new addition')
             return
@@ -28,9 +375,70 @@ class Matcher:
             raise ValueError(f"Result may not be None")
 
         self.match_map[target_str] = result
-        self.match_tree.add(target_str)
+        self.match_index.add(target_str)
+        self.cache.clear()
         self.max_query_len = max(self.max_query_len, len(target_str))
 
+        # the shortest target string is the closest to the normalised string, and doesn't have an article if another one
+        # which normalises to the same string doesn't
+        normalised_target = self.normalise(target_str)
+        shortest_target = self.normalised_map.get(normalised_target)
+        if normalised_target and (shortest_target is None or len(target_str) < len(shortest_target)):
+            self.normalised_map[normalised_target] = target_str
+
+        # only prefixes which leave few enough characters for the prefix layer to accept the target string are stored
+        for prefix_len in range(len(target_str) - 1, 0, -1):
+            prefix = target_str[:prefix_len]
+            if len(target_str) - prefix_len > self.get_match_threshold(prefix):
+                break
+            shortest_target = self.prefix_map.get(prefix)
+            if shortest_target is None or len(target_str) < len(shortest_target):
+                self.prefix_map[prefix] = target_str
+
+    def _add_suffixed(self, target_str: str, suffix: str, result, suppress_warning: bool):
+        """
+        Adds a suffix of an existing target string, with a result object to map to the combination.
+        :param target_str: lower case target string
+        :param suffix: lower case suffix
+        :param result: object to map, may not be None
+        :param suppress_warning: suppress the generation of a warning in the case that the suffix already exists
+        """
+        if target_str not in self.match_map:
+            raise ValueError(f'Match string "{target_str}" must be added before its suffixes')
+        suffix_targets = self.suffix_map.setdefault(suffix, {})
+        if target_str in suffix_targets:
+            if not suppress_warning:
+                logger.warning(f'Match string "{target_str} {suffix}" already exists, ignoring new addition')
+            return
+        elif result is None:
+            raise ValueError(f"Result may not be None")
+
+        suffix_targets[target_str] = result
+        self.cache.clear()
+        self.max_suffix_words = max(self.max_suffix_words, suffix.count(" ") + 1)
+        self.max_query_len = max(self.max_query_len, len(target_str) + 1 + len(suffix))
+
+    def get_targets(self):
+        """
+        :return: generator of every target string, including those with suffixes
+        """
+        yield from self.match_map
+        for suffix, suffix_targets in self.suffix_map.items():
+            for target_str in suffix_targets:
+                yield f"{target_str} {suffix}"
+
+    def suggest(self, input_string: str, count: int, threshold_scale=1.5):
+        """
+        Finds the targets closest to an input string within a looser threshold than a match, to suggest when the input
+        string doesn't match any target. Targets with a suffix aren't suggested.
+        :param input_string: input string to find suggestions for
+        :param count: maximum number of suggestions
+        :param threshold_scale: maximum edit distance of a suggestion, as a multiple of the match threshold
+        :return: list of up to count target strings, closest first
+        """
+        max_distance = threshold_scale * self.get_match_threshold(input_string)
+        return [key for _, key in self.match_index.find_nearest(input_string.lower(), max_distance, count)]
+
     def _get_match_strings(self, input_string: str):
         """
         Return all match keys for an input string
@@ -38,7 +446,7 @@ class Matcher:
         :return: all results, as a list of tuples (edit distance, result key)
         """
         match_threshold = self.get_match_threshold(input_string)
-        return self.match_tree.find(input_string.lower(), match_threshold)
+        return self.match_index.find(input_string.lower(), match_threshold)
 
     def match(self, input_string: str):
         """
@@ -47,13 +455,330 @@ class Matcher:
         :return a tuple of (result object, match key, match quality as a fraction of threshold) if a match is found,
         else None
         """
-        results = self._get_match_strings(input_string)
-        if not results:
+        match_threshold = self.get_match_threshold(input_string)
+        match_key, match_distance = self._find_cached_match(input_string.lower(), match_threshold)
+        return self._get_match(match_key, match_distance, match_threshold)
+
+    def match_many(self, input_strings: list):
+        """
+        Resolves the closest match to each of several input strings, looking up repeated strings only once
+        :param input_strings: input strings to match
+        :return: list of what match would return for each input string
+        """
+        lookups = {}
+        results = []
+        for input_string in input_strings:
+            lower_string = input_string.lower()
+            match_threshold = self.get_match_threshold(input_string)
+            if lower_string not in lookups:
+                lookups[lower_string] = self._find_cached_match(lower_string, match_threshold)
+
+            results.append(self._get_match(*lookups[lower_string], match_threshold))
+        return results
+
+    def _get_match(self, match_key, match_distance: int, match_threshold: float):
+        """
+        :param match_key: key of the match, a target string or a tuple of (target string, suffix), or None
+        :param match_distance: edit distance of the match
+        :param match_threshold: maximum edit distance of a fuzzy match
+        :return: the tuple match returns for the match key
+        """
+        if match_key is None:
             return None
+        elif isinstance(match_key, tuple):
+            target_str, suffix = match_key
+            result, match_key = self.suffix_map[suffix][target_str], f"{target_str} {suffix}"
         else:
-            match_distance, match_key = results[0]
-            match_threshold = self.get_match_threshold(input_string)
-            return self.match_map[match_key], match_key, 1 - match_distance / match_threshold
+            result = self.match_map[match_key]
+        return result, match_key, max(0, 1 - match_distance / match_threshold)
+
+    def _find_cached_match(self, input_string: str, match_threshold: float):
+        """
+        :param input_string: lower case string to match
+        :param match_threshold: maximum edit distance of a fuzzy match
+        :return: tuple of (match key, edit distance), both None if there was no match, where the match key is a target
+        string or a tuple of (target string, suffix)
+        """
+        if input_string in self.cache:
+            self.cache.move_to_end(input_string)
+            self.cache_hits += 1
+            return self.cache[input_string]
+
+        layer, match_key, match_distance = self._find_match(input_string, match_threshold)
+        self.layer_hits[layer] += 1
+        if self.cache_size:
+            self.cache[input_string] = match_key, match_distance
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return match_key, match_distance
+
+    def _find_match(self, input_string: str, match_threshold: float):
+        """
+        :param input_string: lower case string to match
+        :param match_threshold: maximum edit distance of a fuzzy match
+        :return: tuple of (layer which found the match, match key, edit distance), with the key and distance None if
+        there was no match
+        """
+        if input_string in self.match_map:
+            return "exact", input_string, 0
+        for suffix_word_count in range(1, self.max_suffix_words + 1):
+            words = input_string.rsplit(" ", suffix_word_count)
+            target_part, suffix_part = words[0], " ".join(words[1:])
+            if len(words) > suffix_word_count and target_part in self.suffix_map.get(suffix_part, ()):
+                return "exact", (target_part, suffix_part), 0
+
+        candidates = [self._find_suffixed_match(input_string, match_threshold)]
+        normalised_key = self.normalised_map.get(self.normalise(input_string))
+        prefix_key = self.prefix_map.get(input_string)
+        if normalised_key is not None:
+            candidates.append(
+                ("normalised", normalised_key, jellyfish.damerau_levenshtein_distance(input_string, normalised_key))
+            )
+        elif prefix_key is not None:
+            candidates.append(("prefix", prefix_key, len(prefix_key) - len(input_string)))
+
+        best_match = min(filter(None, candidates), key=self._get_match_rank, default=None)
+        if best_match and best_match[0] != "fuzzy" and best_match[2] <= 1:
+            return best_match
+
+        # a fuzzy match of the whole input string is only used if it's at least as close as any fuzzy match with a
+        # suffix, or closer than a match from an earlier layer
+        max_distance = match_threshold
+        if best_match:
+            max_distance = best_match[2] - (best_match[0] != "fuzzy")
+        result = self.match_index.find_closest(input_string, max_distance)
+        if result:
+            return "fuzzy", result[1], result[0]
+        return best_match or ("none", None, None)
+
+    def _find_suffixed_match(self, input_string: str, match_threshold: float):
+        """
+        :param input_string: lower case string to match
+        :param match_threshold: maximum edit distance of a fuzzy match
+        :return: tuple of (layer which found the match, (target string, suffix), edit distance) of the best match with
+        a suffix, or None if there was no match
+        """
+        splits = [(target_part, suffix_match)
+                  for target_part, suffixes in self._split_suffixes(input_string, match_threshold)
+                  for suffix_match in suffixes]
+        splits.sort(key=lambda split: self._get_match_rank(split[1]))
+        best_match = None
+
+        def update_best_match(suffix_match: tuple, target_match: tuple):
+            nonlocal best_match
+            layer = max(suffix_match[0], target_match[0], key=self.layers.index)
+            candidate = layer, (target_match[1], suffix_match[1]), suffix_match[2] + target_match[2]
+            if candidate[2] <= match_threshold and (
+                    best_match is None or self._get_match_rank(candidate) < self._get_match_rank(best_match)):
+                best_match = candidate
+
+        # the match of a split can't be better than the match of its suffix, so splits are tried in that order
+        for target_part, suffix_match in splits:
+            if best_match and self._get_match_rank(best_match) <= self._get_match_rank(suffix_match):
+                break
+            suffix_targets = self.suffix_map[suffix_match[1]]
+            normalised_target = self.normalised_map.get(self.normalise(target_part))
+            prefix_target = self.prefix_map.get(target_part)
+            if target_part in suffix_targets:
+                update_best_match(suffix_match, ("exact", target_part, 0))
+            elif normalised_target in suffix_targets:
+                distance = jellyfish.damerau_levenshtein_distance(target_part, normalised_target)
+                update_best_match(suffix_match, ("normalised", normalised_target, distance))
+            elif prefix_target in suffix_targets:
+                update_best_match(suffix_match, ("prefix", prefix_target, len(prefix_target) - len(target_part)))
+
+        if best_match and best_match[0] != "fuzzy" and best_match[2] <= 1:
+            return best_match
+
+        # fuzzy matches of the target part are only searched for when no earlier layer found a match within one edit,
+        # and only replace a match from an earlier layer if they're closer
+        for target_part, suffix_match in sorted(splits, key=lambda split: split[1][2]):
+            max_distance = match_threshold
+            if best_match:
+                max_distance = best_match[2] - (best_match[0] != "fuzzy")
+            max_distance -= suffix_match[2]
+            if max_distance < 0:
+                break
+            result = self.match_index.find_closest(target_part, max_distance, self.suffix_map[suffix_match[1]])
+            if result:
+                update_best_match(suffix_match, ("fuzzy", result[1], result[0]))
+
+        # with several typos, the closest suffixed target string may only be found by splitting away from the spaces,
+        # which is searched for when no split matched within one edit
+        if best_match is None or best_match[2] > 1:
+            for target_part, suffix_distances in self._split_anywhere(input_string, match_threshold):
+                max_distance = match_threshold if best_match is None else best_match[2] - 1
+                max_distance -= min(suffix_distances.values())
+                if max_distance < 0:
+                    continue
+                for distance, target_str in self.match_index.find(target_part, max_distance):
+                    for suffix, suffix_distance in suffix_distances.items():
+                        if target_str in self.suffix_map[suffix]:
+                            update_best_match(("fuzzy", suffix, suffix_distance), ("fuzzy", target_str, distance))
+
+        return best_match
+
+    def _split_suffixes(self, input_string: str, match_threshold: float):
+        """
+        Splits the input string into the part before a suffix and the suffixes which could match the rest, either at
+        the spaces between its last words, one character to either side of those spaces (as a typo which moves the
+        space is one edit away from the target string, like "sworda 1" for "sword a1"), or where a suffix is joined to
+        the end of the string without a space.
+        :param input_string: lower case string to match
+        :param match_threshold: maximum edit distance of a fuzzy match of the whole input string
+        :return: generator of tuples (start of the input string, list of tuples (layer which found the match, suffix,
+        edit distance) of suffixes matching the rest of the input string)
+        """
+        words = input_string.split(" ")
+        space_index = len(input_string)
+        for suffix_word_count in range(1, min(self.max_suffix_words, len(words) - 1) + 1):
+            space_index -= len(words[-suffix_word_count]) + 1
+            target_part, suffix_part = input_string[:space_index], input_string[space_index + 1:]
+            max_distance = min(match_threshold, self.get_match_threshold(suffix_part))
+            suffixes = self._match_suffixes(suffix_part, max_distance)
+            if suffixes:
+                yield target_part, suffixes
+
+            # moving the space is found by the normalised layer when matching the whole string
+            moved_splits = []
+            if len(target_part) > 1 and target_part[-1] != " ":
+                moved_splits.append((target_part[:-1], target_part[-1] + suffix_part))
+            if len(suffix_part) > 1 and suffix_part[0] != " ":
+                moved_splits.append((target_part + suffix_part[0], suffix_part[1:]))
+            for moved_target_part, moved_suffix_part in moved_splits:
+                suffixes = [(max(layer, "normalised", key=self.layers.index), suffix, distance + 1)
+                            for layer, suffix, distance in self._match_suffixes(moved_suffix_part, max_distance - 1)]
+                if suffixes:
+                    yield moved_target_part, suffixes
+
+        # a missing space is found by the normalised layer when matching the whole string
+        for suffix in self.suffix_map:
+            if len(input_string) > len(suffix) and input_string.endswith(suffix) and \
+                    input_string[-len(suffix) - 1] != " ":
+                yield input_string[:-len(suffix)], [("normalised", suffix, 1)]
+
+    def _split_anywhere(self, input_string: str, match_threshold: float):
+        """
+        Splits the input string at every position near its end, rather than only near its spaces. The edit distance of
+        the whole input string from a suffixed target string is the sum of the edit distances of its parts from the
+        target string and the suffix when split at some position, or with the characters either side of it swapped, so
+        unlike the splits of _split_suffixes, which leave typos around the space out of reach of the suffix's own match
+        threshold, these can find the closest suffixed target string when the input string has several typos.
+        :param input_string: lower case string to match
+        :param match_threshold: maximum edit distance of a fuzzy match of the whole input string
+        :return: list of tuples (start of the input string, dict mapping each suffix to the edit distance of the rest of
+        the input string from the suffix with a space before it), in order of the smallest edit distance
+        """
+        splits = {}
+        max_suffix_len = max(map(len, self.suffix_map), default=0)
+        max_end_len = min(len(input_string) - 1, int(max_suffix_len + 1 + match_threshold))
+        for split_index in range(len(input_string) - max_end_len, len(input_string)):
+            target_part, end = input_string[:split_index], input_string[split_index:]
+            # a transposition of the characters either side of the split is an edit of neither part
+            parts = [(target_part, end, 0), (target_part[:-1] + end[0], target_part[-1] + end[1:], 1)]
+            for target_part, end, split_distance in parts:
+                for suffix in self.suffix_map:
+                    if abs(len(end) - len(suffix) - 1) + split_distance <= match_threshold:
+                        distance = jellyfish.damerau_levenshtein_distance(end, f" {suffix}") + split_distance
+                        suffix_distances = splits.setdefault(target_part, {})
+                        if distance <= min(match_threshold, suffix_distances.get(suffix, distance)):
+                            suffix_distances[suffix] = distance
+        return sorted(((t, d) for t, d in splits.items() if d), key=lambda split: min(split[1].values()))
+
+    def _match_suffixes(self, suffix_part: str, max_distance: float):
+        """
+        :param suffix_part: lower case end of the input string
+        :param max_distance: maximum edit distance of a matching suffix
+        :return: list of tuples (layer which found the match, suffix, edit distance) of the suffixes matching the end of
+        the input string
+        """
+        suffixes = []
+        if max_distance < 0:
+            return suffixes
+        for suffix in self.suffix_map:
+            if suffix == suffix_part:
+                suffixes.append(("exact", suffix, 0))
+            elif suffix.startswith(suffix_part) and len(suffix) - len(suffix_part) <= max_distance:
+                suffixes.append(("prefix", suffix, len(suffix) - len(suffix_part)))
+            else:
+                distance = jellyfish.damerau_levenshtein_distance(suffix_part, suffix)
+                if distance <= max_distance:
+                    suffixes.append(("fuzzy", suffix, distance))
+        return suffixes
+
+    def _get_match_rank(self, match: tuple):
+        """
+        :param match: tuple of (layer which found the match, match key, edit distance)
+        :return: sort key placing matches in order of preference: the closest match, then the one from the earliest
+        layer
+        """
+        return match[2], self.layers.index(match[0])
+
+    def save(self, file_path: str, inputs_hash: str, get_reference: typing.Callable = lambda obj: None):
+        """
+        Writes the targets and indexes of this matcher to a file, so that an identical matcher can be loaded without
+        adding the targets again.
+        :param file_path: path of the file to write
+        :param inputs_hash: hash of everything the targets were created from, which must match when loading
+        :param get_reference: function returning a picklable reference to use in place of an object (such as a result
+        object which is stored elsewhere), or None to pickle the object itself
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_file_path = file_path + ".tmp"
+        with open(temp_file_path, "wb") as file:
+            pickle.dump({"version": self.FILE_VERSION, "inputs_hash": inputs_hash}, file)
+            pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = get_reference
+            pickler.dump({attr_name: getattr(self, attr_name) for attr_name in self.saved_attributes})
+        os.replace(temp_file_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str, inputs_hash: str, resolve_reference: typing.Callable = None, **kwargs):
+        """
+        Loads a matcher written by save, if it was created from the same inputs.
+        :param file_path: path of the file to read
+        :param inputs_hash: hash of everything the targets should have been created from
+        :param resolve_reference: function returning the object for a reference created by the get_reference function
+        passed to save, which should raise pickle.UnpicklingError if the object no longer exists
+        :param kwargs: arguments to create the matcher with, which must include the same engine that the saved matcher
+        was created with
+        :return: the loaded matcher, or None if the file doesn't exist, can't be read or was created from different
+        inputs
+        """
+        matcher = cls(**kwargs)
+        # noinspection PyBroadException
+        try:
+            with open(file_path, "rb") as file:
+                header = pickle.load(file)
+                if header.get("version") != cls.FILE_VERSION or header.get("inputs_hash") != inputs_hash:
+                    return None
+                unpickler = pickle.Unpickler(file)
+                if resolve_reference:
+                    unpickler.persistent_load = resolve_reference
+                saved_state = unpickler.load()
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f"Could not load matcher from {file_path}:")
+            return None
+
+        if type(saved_state["match_index"]) is not type(matcher.match_index):
+            return None
+        for attr_name, value in saved_state.items():
+            setattr(matcher, attr_name, value)
+        return matcher
+
+    def get_stats(self) -> str:
+        """
+        :return: description of the cache hit rate, and the number of uncached lookups which each layer has matched
+        """
+        uncached = sum(self.layer_hits.values())
+        total = uncached + self.cache_hits
+        layer_descriptions = ", ".join(
+            f"{name} {hits / uncached if uncached else 0:.1%}" for name, hits in self.layer_hits.items()
+        )
+        return f"{total} lookups, {self.cache_hits / total if total else 0:.1%} cached " \
+            f"({len(self.cache)}/{self.cache_size} entries), {uncached} uncached ({layer_descriptions})"
 
 
 logger.info(f"Using {jellyfish.library} version of Jellyfish")
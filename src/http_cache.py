@@ -0,0 +1,199 @@
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import contextlib
+import concurrent.futures
+import aiohttp
+import config
+import util
+
+logger = logging.getLogger(__name__)
+
+
+class HttpCache:
+    """
+    On-disk cache of responses to HTTP GET requests. Cached responses are revalidated using conditional requests, so
+    unchanged responses are not downloaded again. Responses without an ETag or Last-Modified header can't be
+    revalidated, so they're only stored when the request accepts a cached response without revalidating it. Response
+    bodies are stored by the hash of their content, and the least recently used responses are evicted when the total
+    size of stored bodies exceeds the size limit. The index and the stored bodies are only accessed from the cache's own
+    worker thread, so that disk access doesn't block the event loop.
+    """
+    def __init__(self, directory: str, max_size: int):
+        """
+        :param directory: directory to store the cache in
+        :param max_size: maximum total size of stored response bodies, in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._initialised = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="http_cache")
+
+    async def _run(self, function, *args):
+        """
+        Runs a synchronous function which accesses the index or stored bodies in the cache's worker thread.
+        :param function: function to run
+        :param args: arguments to call the function with
+        :return: the return value of the function
+        """
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    @contextlib.contextmanager
+    def _get_cursor(self):
+        if not self._initialised:
+            os.makedirs(self.directory, exist_ok=True)
+
+        with contextlib.closing(sqlite3.connect(os.path.join(self.directory, "index.db"))) as connection:
+            with connection:
+                with contextlib.closing(connection.cursor()) as cursor:
+                    if not self._initialised:
+                        cursor.execute(
+                            "CREATE TABLE IF NOT EXISTS responses ("
+                            "url TEXT PRIMARY KEY,"
+                            "etag TEXT,"
+                            "last_modified TEXT,"
+                            "body_hash TEXT,"
+                            "size INTEGER,"
+                            "stored_time REAL,"
+                            "access_time REAL)")
+                        self._initialised = True
+                    yield cursor
+
+    def _get_body_path(self, body_hash: str):
+        return os.path.join(self.directory, body_hash)
+
+    def _read_body(self, body_hash: str):
+        try:
+            with open(self._get_body_path(body_hash), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _get_entry(self, url: str):
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT etag, last_modified, body_hash, stored_time FROM responses WHERE url = ?", (url,))
+            return cursor.fetchone()
+
+    def _remove_entry(self, url: str):
+        with self._get_cursor() as cursor:
+            cursor.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    async def get(self, session: aiohttp.ClientSession, url: str, max_age=0) -> bytes:
+        """
+        Performs a GET request for a URL, using a cached response where possible. Only successful responses are cached,
+        and only if they can be revalidated or max_age is set.
+        :param session: aiohttp.ClientSession to use for the request
+        :param url: URL to request
+        :param max_age: age in seconds up to which a cached response is used without revalidating it
+        :return: body of the response
+        """
+        entry = await self._run(self._get_entry, url)
+
+        headers = {}
+        if entry:
+            etag, last_modified, body_hash, stored_time = entry
+            if time.time() - stored_time < max_age:
+                body = await self._run(self._read_body, body_hash)
+                if body is not None:
+                    await self._record_hit(url, body)
+                    return body
+
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and entry:
+                body = await self._run(self._read_body, entry[2])
+                if body is not None:
+                    await self._record_hit(url, body, revalidated=True)
+                    return body
+            else:
+                body = await response.read()
+                self.misses += 1
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                if response.status == 200 and (etag or last_modified or max_age > 0):
+                    await self._run(self._store, url, etag, last_modified, body)
+                return body
+
+        # the cached body has been removed from disk, so it needs to be requested again without validation
+        await self._run(self._remove_entry, url)
+        return await self.get(session, url, max_age)
+
+    async def _record_hit(self, url: str, body: bytes, revalidated=False):
+        self.hits += 1
+        self.bytes_saved += len(body)
+        await self._run(self._update_access_time, url, revalidated)
+
+    def _update_access_time(self, url: str, revalidated: bool):
+        with self._get_cursor() as cursor:
+            if revalidated:
+                cursor.execute(
+                    "UPDATE responses SET stored_time = ?, access_time = ? WHERE url = ?",
+                    (time.time(), time.time(), url)
+                )
+            else:
+                cursor.execute("UPDATE responses SET access_time = ? WHERE url = ?", (time.time(), url))
+
+    def _store(self, url: str, etag: str, last_modified: str, body: bytes):
+        body_hash = hashlib.sha256(body).hexdigest()
+        body_path = self._get_body_path(body_hash)
+        if not os.path.exists(body_path):
+            with open(body_path + ".tmp", "wb") as file:
+                file.write(body)
+            os.replace(body_path + ".tmp", body_path)
+
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT body_hash FROM responses WHERE url = ?", (url,))
+            previous = cursor.fetchone()
+            cursor.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body_hash, len(body), time.time(), time.time())
+            )
+            if previous and previous[0] != body_hash:
+                self._remove_unused_body(cursor, previous[0])
+            self._evict(cursor)
+
+    def _evict(self, cursor: sqlite3.Cursor):
+        cursor.execute("SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM responses GROUP BY body_hash)")
+        total_size = cursor.fetchone()[0] or 0
+        if total_size <= self.max_size:
+            return
+
+        cursor.execute("SELECT url, body_hash, size FROM responses ORDER BY access_time")
+        for url, body_hash, size in cursor.fetchall():
+            cursor.execute("DELETE FROM responses WHERE url = ?", (url,))
+            if self._remove_unused_body(cursor, body_hash):
+                total_size -= size
+            if total_size <= self.max_size:
+                break
+
+    def _remove_unused_body(self, cursor: sqlite3.Cursor, body_hash: str):
+        cursor.execute("SELECT COUNT(*) FROM responses WHERE body_hash = ?", (body_hash,))
+        if cursor.fetchone()[0] > 0:
+            return False
+
+        try:
+            os.remove(self._get_body_path(body_hash))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def get_stats(self) -> str:
+        """
+        :return: description of the cache hits and misses since startup
+        """
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), " \
+            f"{self.bytes_saved / 1024 / 1024:.1f} MB saved"
+
+
+cache = HttpCache(util.path("data/http_cache"), config.get_global("general")["http_cache_max_size"])
@@ -1,4 +1,5 @@
 import discord
+import asyncio
 import os
 import logging
 import bot_modules
@@ -16,6 +17,7 @@ log_config.configure_file(util.path("log.txt"))
 logger = logging.getLogger(__name__)
 
 initialised = False
+startup_update: asyncio.Future = None
 client = discord.Client()
 config.init_configuration()
 bot_modules.import_modules()
@@ -23,16 +25,24 @@ bot_modules.import_modules()
 
 @client.event
 async def on_ready():
-    global initialised
+    global initialised, startup_update
     if not initialised:
         log_config.configure_discord(client)
+        data.abc.EmbedContentGenerator.load_templates()
 
-        await data.update_repositories()
+        snapshot_loaded = await data.load_repositories_from_snapshot()
+        if not snapshot_loaded:
+            await data.update_repositories()
         await Hook.get("on_init")(client)
 
         initialised = True
         logger.info(f"{client.user.name}'s ready to go!")
 
+        if snapshot_loaded:
+            # serve from the snapshot while the latest data is downloaded. The task is kept so that it can't be garbage
+            # collected before it finishes, and the hook logs any exception the update raises.
+            startup_update = asyncio.ensure_future(Hook.get("download_data")())
+
     await Hook.get("on_ready")()
 
 
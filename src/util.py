@@ -5,10 +5,18 @@ import io
 import discord
 import pathlib
 import hashlib
+import time
+import typing
+import asyncio
+import concurrent.futures
 
 
 logger = logging.getLogger(__name__)
 
+# background work runs one task at a time, in the order it was submitted
+background_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+STALL_CHECK_INTERVAL = 0.01
+
 
 def get_emote(name) -> str:
     """
@@ -115,3 +123,34 @@ def get_wiki_cdn_url(asset_name):
     asset_name_safe = urllib.parse.quote(asset_name.replace(" ", "_"))
     md5_chars = hashlib.md5(asset_name_safe.encode("utf-8")).hexdigest()[:2]
     return f"https://gamepedia.cursecdn.com/dragalialost_gamepedia_en/{md5_chars[0]}/{md5_chars}/{asset_name_safe}"
+
+
+async def run_in_background(function: typing.Callable, description: str):
+    """
+    Runs a synchronous function in the background worker thread, so that the event loop can keep handling events while
+    it runs. Background functions run one at a time in the order they were submitted, so the result of an earlier call
+    is never returned after the result of a later one. Logs how long the function took to run, and the longest time
+    the event loop was stalled during that time.
+    :param function: function to run, which mustn't modify anything used by the event loop
+    :param description: description of what the function does, for the log message
+    :return: the return value of the function
+    """
+    max_stall = 0
+
+    async def monitor_stalls():
+        nonlocal max_stall
+        while True:
+            expected_time = time.perf_counter() + STALL_CHECK_INTERVAL
+            await asyncio.sleep(STALL_CHECK_INTERVAL)
+            max_stall = max(max_stall, time.perf_counter() - expected_time)
+
+    start_time = time.perf_counter()
+    monitor_task = asyncio.ensure_future(monitor_stalls())
+    try:
+        result = await asyncio.get_event_loop().run_in_executor(background_executor, function)
+    finally:
+        monitor_task.cancel()
+
+    logger.info(f"{description} in {time.perf_counter() - start_time:.2f} seconds "
+                f"(longest event loop stall {max_stall * 1000:.0f} ms)")
+    return result